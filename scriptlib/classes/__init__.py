@@ -4,4 +4,10 @@ from . import console
 from . import config
 from . import argparser
 from . import logger
-from . import subscript
\ No newline at end of file
+from . import subscript
+from . import search
+from . import logstore
+from . import gapbuffer
+from . import history
+from . import commands
+from . import dashboard
\ No newline at end of file
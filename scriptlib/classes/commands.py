@@ -0,0 +1,443 @@
+"""
+scriptlib.classes.commands
+
+Command registry for the integrated console.
+Subscripts and the script itself register commands here,
+which can then be run (and tab-completed) from the console.
+"""
+
+import asyncio
+import shlex
+from typing import Callable, List, Optional, Tuple
+
+from ..utils import (
+    colors,
+    errorhandler,
+    exceptions
+)
+
+import scriptlib
+
+class Trie:
+    """
+    Prefix tree of command names, for tab completion.
+
+    Finding completions only walks the prefix (plus however
+    far the completion extends), no matter how many
+    commands are registered.
+    """
+
+    def __init__(
+            self
+        ) -> None:
+        self.root = TrieNode()
+
+    def insert(
+            self,
+            word: str
+        ) -> None:
+        """
+        Adds a word.
+
+        Arguments:
+            word: str
+        """
+
+        node = self.root
+        node.count += 1
+
+        for char in word:
+            if char not in node.children:
+                node.children[char] = TrieNode()
+
+            node = node.children[char]
+            node.count += 1
+
+        node.terminal = True
+
+    def remove(
+            self,
+            word: str
+        ) -> None:
+        """
+        Removes a word, if it exists.
+
+        Arguments:
+            word: str
+        """
+
+        # Make sure it's actually here first
+        node = self.find(word)
+
+        if node is None or not node.terminal:
+            return
+
+        node = self.root
+        node.count -= 1
+
+        for char in word:
+            child = node.children[char]
+            child.count -= 1
+
+            if child.count == 0:
+                del node.children[char]
+                return
+
+            node = child
+
+        node.terminal = False
+
+    def find(
+            self,
+            prefix: str
+        ) -> Optional["TrieNode"]:
+        """
+        Finds the node for a prefix.
+
+        Arguments:
+            prefix: str
+        """
+
+        node = self.root
+
+        for char in prefix:
+            if char not in node.children:
+                return None
+
+            node = node.children[char]
+
+        return node
+
+    def complete(
+            self,
+            prefix: str
+        ) -> Tuple[Optional[str], bool]:
+        """
+        Extends a prefix as far as it unambiguously goes.
+
+        Arguments:
+            prefix: str - Text to complete
+
+        Returns:
+            completion: Optional[str] - Extended prefix, or None if
+                nothing starts with it
+            unique: bool - Whether the completion is a whole
+                word with nothing else starting with it
+        """
+
+        node = self.find(prefix)
+
+        if node is None:
+            return None, False
+
+        comp = [prefix]
+
+        # Follow the only path until it branches or a word ends
+        while not node.terminal and len(node.children) == 1:
+            char, node = next(iter(node.children.items()))
+            comp.append(char)
+
+        return "".join(comp), node.terminal and node.count == 1
+
+    def words(
+            self,
+            prefix: str,
+            limit: int = 20
+        ) -> List[str]:
+        """
+        Lists words starting with a prefix.
+
+        Arguments:
+            prefix: str
+            limit: int - Max words to return
+
+        Returns:
+            words: List[str] - Matching words, alphabetically
+        """
+
+        node = self.find(prefix)
+
+        if node is None:
+            return []
+
+        comp = []
+        stack = [(prefix, node)]
+
+        while stack and len(comp) < limit:
+            word, node = stack.pop()
+
+            if node.terminal:
+                comp.append(word)
+
+            for char in sorted(node.children, reverse = True):
+                stack.append((word + char, node.children[char]))
+
+        return comp
+
+class TrieNode:
+    """
+    One node (character) in a Trie.
+    """
+
+    __slots__ = ("children", "terminal", "count")
+
+    def __init__(
+            self
+        ) -> None:
+        self.children = {}
+        self.terminal = False
+        # Number of words at or below this node
+        self.count = 0
+
+class CommandRegistry:
+    """
+    Holds all console commands.
+
+    Sample command:
+        scriptlib.terminal.console.commands.register(
+            "greet",
+            self.greet, # Async function. Receives parsed args.
+            "Says hi.",
+            args = [
+                ("name", "str[len(1,32)]"), # Argument parser rules
+                ("times", "int[between(1,10)]")
+            ]
+        )
+    """
+
+    def __init__(
+            self
+        ) -> None:
+
+        self.commands = {}
+        self.trie = Trie()
+
+    def register(
+            self,
+            name: str,
+            function: Callable,
+            description: str = "No description.",
+            args: List[Tuple[str, str]] = []
+        ) -> None:
+        """
+        Registers a command.
+
+        Arguments:
+            name: str - Name typed in the console
+            function: Callable - Async function to run. Called
+                with each parsed argument, in order.
+            description: str - Shown in 'help'
+            args: List[Tuple[str, str]] - Argument names & their
+                argument parser rules. The last argument gets
+                everything left over.
+        """
+
+        name = name.lower()
+
+        if " " in name or name == "":
+            raise exceptions.DevError(f"Invalid command name '{name}'")
+
+        if not asyncio.iscoroutinefunction(function):
+            raise exceptions.DevError(f"Function for command {name} must be async")
+
+        if name in self.commands:
+            raise exceptions.DevError(f"Command {name} is already registered")
+
+        self.commands[name] = {
+            "name": name,
+            "function": function,
+            "description": description,
+            "args": list(args),
+            "compiled": None
+        }
+
+        self.trie.insert(name)
+
+    def unregister(
+            self,
+            name: str
+        ) -> None:
+        """
+        Removes a command.
+
+        Arguments:
+            name: str
+        """
+
+        name = name.lower()
+
+        if name in self.commands:
+            del self.commands[name]
+            self.trie.remove(name)
+
+    def complete(
+            self,
+            line: str
+        ) -> Tuple[str, List[str]]:
+        """
+        Tab-completes a command name.
+
+        Arguments:
+            line: str - Current console line
+
+        Returns:
+            line: str - Completed line
+            candidates: List[str] - Possible commands, if the
+                completion was ambiguous
+        """
+
+        # Only the command name is completed
+        if " " in line:
+            return line, []
+
+        completion, unique = self.trie.complete(line.lower())
+
+        if completion is None:
+            return line, []
+
+        if unique:
+            return f"{completion} ", []
+
+        if completion == line.lower():
+            return line, self.trie.words(completion)
+
+        return completion, []
+
+    def execute(
+            self,
+            line: str
+        ) -> None:
+        """
+        Dispatches a command on the event loop.
+        Safe to call from the console thread.
+
+        Arguments:
+            line: str - Console line
+        """
+
+        asyncio.run_coroutine_threadsafe(
+            errorhandler.wrap(
+                self.dispatch(line)
+            ),
+            scriptlib.loop
+        )
+
+    async def dispatch(
+            self,
+            line: str
+        ) -> None:
+        """
+        Parses and runs a command.
+
+        Arguments:
+            line: str - Console line
+        """
+
+        try:
+            parts = shlex.split(line)
+
+        except ValueError:
+            parts = line.split()
+
+        if len(parts) == 0:
+            return
+
+        name, values = parts[0].lower(), parts[1:]
+
+        if name not in self.commands:
+            scriptlib.script.logger.log("warn", "console", f"Unknown command '{name}'. Try 'help'.")
+            return
+
+        command = self.commands[name]
+        args = command["args"]
+
+        # Compile rules once
+        if command["compiled"] is None:
+            command["compiled"] = [
+                await scriptlib.script.args.compile_recursive(rule)
+                for _, rule in args
+            ]
+
+        if len(values) < len(args):
+            scriptlib.script.logger.log("error", "console", f"Usage: {self.usage(command)}")
+            return
+
+        # Last argument gets everything else
+        if len(args) > 0 and len(values) > len(args):
+            values = values[:len(args) - 1] + [" ".join(values[len(args) - 1:])]
+
+        parsed = []
+        for (arg_name, rule), compiled, value in zip(args, command["compiled"], values):
+            valid, result = await scriptlib.script.args.parse(
+                compiled,
+                value,
+                {}
+            )
+
+            if not valid:
+                scriptlib.script.logger.log("error", "console", f"Invalid value for {arg_name}: {', '.join(result)}")
+                scriptlib.script.logger.log_step("error", "console", f"Usage: {self.usage(command)}")
+                return
+
+            parsed.append(result)
+
+        await command["function"](*parsed)
+
+    def usage(
+            self,
+            command: dict
+        ) -> str:
+        """
+        Generates a usage string for a command.
+
+        Arguments:
+            command: dict - Registered command
+        """
+
+        return " ".join([command["name"]] + [f"<{name}>" for name, _ in command["args"]])
+
+    def register_defaults(
+            self
+        ) -> None:
+        """
+        Registers built-in commands.
+        """
+
+        self.register(
+            "help",
+            self.help,
+            "Lists all commands."
+        )
+
+        self.register(
+            "search",
+            self.search,
+            "Searches the logs. Ctrl + N/P to jump between matches.",
+            args = [
+                ("query", "str")
+            ]
+        )
+
+    async def help(
+            self
+        ) -> None:
+        """
+        Lists all commands.
+        """
+
+        scriptlib.script.logger.log("info", "console", "Commands:", bold = True)
+
+        for name in sorted(self.commands):
+            command = self.commands[name]
+
+            scriptlib.script.logger.log_step("info", "console", f"{colors.TerminalColors.BOLD}{self.usage(command)}{colors.TerminalColors.RESET} - {command['description']}")
+
+    async def search(
+            self,
+            query: str
+        ) -> None:
+        """
+        Searches the logs.
+        """
+
+        scriptlib.terminal.search(query)
\ No newline at end of file
@@ -52,6 +52,7 @@ class Config:
         # Reserve some keywords
         self._sample_conf = None
         self._types_conf = None
+        self._defaults_conf = None
 
         # Read file
         try:
@@ -130,6 +131,7 @@ class Config:
         path = f"{os.path.dirname(inspect.getfile(scriptlib))}/config/"
         sample_path = f"{path}config.sample.{self._ext}"
         types_path = f"{path}config.types.yml"
+        defaults_path = f"{path}config.defaults.yml"
 
         # Load up sample
         if not os.path.exists(sample_path):
@@ -148,6 +150,16 @@ class Config:
         # Parse from YAML - samples will all use this, regardless of type.
         self._types_conf = yaml.safe_load(data)
 
+        # Load up defaults for optional values
+        if os.path.exists(defaults_path):
+            async with aiofiles.open(defaults_path, "r") as f:
+                data = await f.read()
+
+            self._defaults_conf = yaml.safe_load(data)
+
+        if self._defaults_conf is None:
+            self._defaults_conf = {}
+
     async def validate_all(
             self
         ) -> None:
@@ -160,7 +172,13 @@ class Config:
         for name, rule in self._types_conf.items():
             # Check exists
             if not hasattr(self, name):
-                await self.invalid_conf(f"Missing key '{name}'.", opt = name)
+                if name in self._defaults_conf:
+                    # Optional - fill in the default
+                    setattr(self, name, self._defaults_conf[name])
+                    self._data[name] = self._defaults_conf[name]
+
+                else:
+                    await self.invalid_conf(f"Missing key '{name}'.", opt = name)
                 
             value = getattr(self, name)
 
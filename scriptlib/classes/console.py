@@ -11,9 +11,12 @@ import re
 import asyncio
 import traceback
 from enum import Enum
-from typing import Callable
+from typing import Optional
 
 from .terminal import ConsoleModes
+from .gapbuffer import GapBuffer
+from .history import History
+from .commands import CommandRegistry
 from ..utils import (
     colors,
     errorhandler
@@ -24,6 +27,16 @@ import scriptlib
 # Will be skipped by ctrl + backspace.
 chars = "abcdefghijklmnopqrstuvwxyz0123456789"
 
+def is_word(
+        char: str
+    ) -> bool:
+    """
+    Checks if a character is part of a word (for ctrl + arrow
+    and ctrl + backspace).
+    """
+
+    return char.lower() in chars
+
 class Console:
     """
     Class that handles input and commands from the
@@ -36,13 +49,23 @@ class Console:
         self.term = scriptlib.terminal
 
         self.current = {
-            ConsoleModes.REGULAR: "",
-            ConsoleModes.ASK: "",
-            ConsoleModes.MENU: None
+            ConsoleModes.REGULAR: GapBuffer(),
+            ConsoleModes.ASK: GapBuffer(),
+            ConsoleModes.MENU: GapBuffer(),
+            ConsoleModes.HISTORY: GapBuffer()
         }
 
-        self.history = []
+        self.history = History()
         self.hist_current = None
+        # In-progress line, restored after scrolling through history
+        self.hist_draft = None
+
+        # Reverse history search (ctrl + R)
+        self.hist_query = None
+        self.hist_match = None
+
+        self.commands = CommandRegistry()
+        self.commands.register_defaults()
 
         self.mode = ConsoleModes.REGULAR
 
@@ -51,6 +74,9 @@ class Console:
 
         self.location = 0
 
+        # First character shown in the console line, for horizontal scrolling
+        self.view = 0
+
         self.shutdown = False
 
         self.sequences = {
@@ -61,8 +87,8 @@ class Console:
             336: lambda *args: Actions.history(*args, 1), #lambda *args: Actions.scroll(*args, 1), # Shift arrow down
             339: lambda *args: Actions.scroll(*args, -1 * (self.term.term.height - 8)), # Page up
             338: lambda *args: Actions.scroll(*args, self.term.term.height - 8), # Page down
-            259: lambda *args: Actions.scroll(*args, -1), # Arrow up
-            258: lambda *args: Actions.scroll(*args, 1), # Arrow down
+            259: lambda *args: Actions.select(*args, -1), # Arrow up
+            258: lambda *args: Actions.select(*args, 1), # Arrow down
             361: Actions.activate_esc,
             #385: Actions.shutdown,
             #360: Actions.shutdown,
@@ -74,6 +100,11 @@ class Console:
 
         self.chars = {
             "\x17": Actions.backspace,
+            "\x0e": lambda *args: Actions.search_next(*args, 1), # Ctrl N
+            "\x10": lambda *args: Actions.search_next(*args, -1), # Ctrl P
+            "\x12": Actions.reverse_search, # Ctrl R
+            "\x07": Actions.cancel_search, # Ctrl G
+            "\t": Actions.complete, # Tab
             #"\x04": Actions.shutdown
         }
 
@@ -114,13 +145,21 @@ class Console:
                     # Check for escape chars
                     if self.escape:
                         self.escape = False
-                        self.set_current("")
-                        self.location = 0
+
+                        if self.mode == ConsoleModes.HISTORY:
+                            Actions.cancel_search(self, char)
+
+                        else:
+                            self.set_current("")
+                            self.location = 0
+
                         self.term.reprint(console = True)
 
                     continue
 
-                self.got_input(char)
+                # Handle anything left over from reading pasted text
+                while char:
+                    char = self.got_input(char)
 
             except Exception as e:
                 errorhandler.log_exception(e)
@@ -128,11 +167,18 @@ class Console:
     def got_input(
             self,
             char
-        ) -> None:
+        ):
         """
         Fired when a character is received.
+
+        Returns:
+            leftover: Optional[Keystroke] - A key that was read
+                ahead while collecting plain text, which still
+                has to be handled
         """
 
+        leftover = None
+
         # Check for sequence characters
         if char.is_sequence:
             code = char.code
@@ -186,12 +232,54 @@ class Console:
 
             # Append to current if not a command
             if not run:
-                self.insert_current(self.location, char.__str__())
+                # Pull in everything else that's already waiting (ie: pastes),
+                # so it's inserted and drawn once instead of per character
+                text, leftover = self.read_plain(char.__str__())
+
+                self.insert_current(self.location, text)
 
-                self.location += 1
+                self.location += len(text)
+
+        # Keep reverse search results in sync with the query
+        if self.mode == ConsoleModes.HISTORY:
+            Actions.update_search(self)
+
+        if leftover:
+            self.term.reprint(console = True)
+            return leftover
 
         self.term.reprint(logs = True, console = True)
 
+    def read_plain(
+            self,
+            text: str
+        ):
+        """
+        Reads any plain characters that are already waiting
+        in the input buffer.
+
+        Arguments:
+            text: str - Text read so far
+
+        Returns:
+            text: str - All plain text read
+            leftover: Optional[Keystroke] - The first non-plain
+                key read, which still has to be handled
+        """
+
+        comp = [text]
+
+        while True:
+            char = self.term.getch(timeout = 0)
+
+            if not char:
+                return "".join(comp), None
+
+            if char.is_sequence or str(char) in self.chars or str(char) == "\x1b":
+                return "".join(comp), char
+
+            comp.append(str(char))
+
     def set_current(
             self,
             new: str
@@ -204,30 +292,23 @@ class Console:
             new: str - String to replace with
         """
 
-        self.current[self.mode] = new
+        self.current[self.mode].set(new)
+        self.view = 0
 
     def insert_current(
             self,
             index: int,
             new: str
-        ) -> str:
+        ) -> None:
         """
-        Inserts 'new' at the specified 'index' and returns
-        the new current string.
+        Inserts 'new' at the specified 'index'.
         
         Arguments:
             index: int - Index to insert before
             new: str - String to insert at that location
-        
-        Returns:
-            current: str - New current string
         """
 
-        current = self.current[self.mode]
-
-        self.current[self.mode] = f"{current[:self.location]}{new}{current[self.location:]}"
-
-        return self.current[self.mode]
+        self.current[self.mode].insert(index, new)
 
     def get_current(
             self
@@ -236,8 +317,70 @@ class Console:
         Returns the current console string.
         """
 
+        return str(self.current[self.mode])
+
+    def get_buffer(
+            self
+        ) -> GapBuffer:
+        """
+        Returns the current console buffer, without
+        joining it into a string.
+        """
+
         return self.current[self.mode]
 
+    def get_visible(
+            self,
+            width: int
+        ) -> str:
+        """
+        Scrolls the console line horizontally so the cursor
+        is visible, then returns the visible section.
+
+        Arguments:
+            width: int - Characters that fit on screen
+
+        Returns:
+            visible: str - Visible part of the current line
+        """
+
+        buffer = self.current[self.mode]
+        width = max(width, 1)
+
+        if self.location < self.view:
+            self.view = self.location
+
+        elif self.location >= self.view + width:
+            self.view = self.location - width + 1
+
+        # Don't leave blank space if the line got shorter
+        self.view = max(0, min(self.view, len(buffer) - width + 1))
+
+        return buffer.slice(self.view, self.view + width)
+
+    def get_selection(
+            self
+        ) -> Optional[int]:
+        """
+        Gets the menu option picked by the number in the
+        console line.
+
+        Returns:
+            index: Optional[int] - 0-indexed option, or None if
+                the number isn't one of them
+        """
+
+        try:
+            index = int(str(self.current[ConsoleModes.MENU])) - 1
+
+        except ValueError:
+            return None
+
+        if index < 0 or index >= len(self.term.menu_mode.get("options", [])):
+            return None
+
+        return index
+
 
 
 console_headers = {
@@ -255,11 +398,34 @@ class Actions:
         Executes a command.
         """
 
+        if self.mode == ConsoleModes.HISTORY:
+            Actions.accept_search(self, char)
+            return
+
+        if self.mode == ConsoleModes.MENU:
+            # The menu logs the choice itself, and it's not worth
+            # keeping in the history
+            self.location = 0
+            scriptlib.terminal.menu_mode["complete"] = True
+            return
+
         if self.mode == ConsoleModes.ASK:
             scriptlib.terminal.ask_mode["complete"] = True
 
         current = self.get_current()
-        self.history.append(current)
+
+        # Answers to questions can be secrets - only commands are kept
+        if self.mode == ConsoleModes.REGULAR:
+            self.history.add(current)
+
+        self.location = 0
+        self.hist_current = None
+
+        # Searches aren't logged, so they don't show up as matches
+        if self.mode == ConsoleModes.REGULAR and current.startswith("/"):
+            self.set_current("")
+            self.term.search(current[1:])
+            return
 
         mode, char = console_headers[self.mode]
         self.term.log(f"{self.term.color[mode]}{colors.TerminalColors.BOLD}{char} {colors.TerminalColors.RESET}{self.term.color[mode]}{current}", True)
@@ -267,8 +433,49 @@ class Actions:
         if self.mode == ConsoleModes.REGULAR:
             self.set_current("")
 
-        self.location = 0
-        self.hist_current = None
+            if current.strip() != "":
+                self.commands.execute(current)
+
+    def complete(
+            self,
+            char: str
+        ) -> None:
+        """
+        Tab-completes the command being typed.
+        """
+
+        if self.mode != ConsoleModes.REGULAR:
+            return
+
+        current = self.get_current()
+
+        # Only complete at the end of the line
+        if self.location != len(current):
+            return
+
+        completion, candidates = self.commands.complete(current)
+
+        if len(candidates) > 0:
+            self.term.log(f"{self.term.color['secondary']}{'  '.join(candidates)}", True)
+
+        elif completion != current:
+            self.set_current(completion)
+            self.location = len(completion)
+
+    def search_next(
+            self,
+            char: str,
+            direction: int
+        ) -> None:
+        """
+        Jumps between matches of the active log search.
+        Start a search by entering '/query' in the console.
+
+        Arguments:
+            direction: int - 1 for next, -1 for previous
+        """
+
+        self.term.search_next(direction)
 
     def backspace(
             self,
@@ -278,31 +485,22 @@ class Actions:
         Handles backspace and ctrl + backspace.
         """
 
-        inp = self.get_current()
+        buffer = self.get_buffer()
 
         if char == "\x7f":
             # Backspace
             index = self.location - 1
 
             if index >= 0:
-                self.set_current(f"{inp[:index]}{inp[index + 1:]}")
+                buffer.delete(index, self.location)
                 self.location = index
 
         elif char in ["\x08", "\x17"]:
             # Ctrl backspace
-            # Start at index, remove until first char not in "abcd...."
-            low_index = Actions.find_next( # TODO: Move to utils
-                lambda char: char.lower() not in chars,
-                lambda i: i == self.location - 1,
-                reversed(list(enumerate(inp[:self.location]))),
-                0
-            )
-
-            if low_index != 0:
-                low_index += 1
-
-            # Remove everything in between
-            self.set_current(f"{inp[:low_index]}{inp[self.location:]}")
+            # Remove everything back to the start of the previous word
+            low_index = buffer.word_bound(self.location, -1, is_word)
+
+            buffer.delete(low_index, self.location)
             self.location = low_index
 
     def delete(
@@ -312,11 +510,8 @@ class Actions:
         """
         Handles del.
         """
-        index = self.location
-        current = self.get_current()
 
-        if index < len(current):
-            self.set_current(f"{current[:index]}{current[index + 1:]}")
+        self.get_buffer().delete(self.location, self.location + 1)
 
     def scroll(
             self,
@@ -332,6 +527,39 @@ class Actions:
 
         self.term.scroll(diff)
 
+    def select(
+            self,
+            char: str,
+            diff: int
+        ) -> None:
+        """
+        Moves between options in menu mode. Scrolls
+        otherwise.
+
+        Arguments:
+            diff: int - Options (or lines) to move by
+        """
+
+        if self.mode != ConsoleModes.MENU:
+            Actions.scroll(self, char, diff)
+            return
+
+        count = len(self.term.menu_mode["options"])
+
+        if count == 0:
+            return
+
+        selected = self.get_selection()
+
+        if selected is None:
+            # Nothing valid typed in - start from the nearest end
+            selected = -1 if diff > 0 else count
+
+        selected = (selected + diff) % count
+
+        self.set_current(str(selected + 1))
+        self.location = len(self.get_buffer())
+
     def activate_esc(
             self,
             char: str
@@ -352,67 +580,7 @@ class Actions:
         Handles long scrolling (ctrl + arrow) in the console.
         """
 
-        current = self.get_current()
-
-        if direction > 0:
-            # Find first non-alpha char after location.
-            scroll_to = Actions.find_next(
-                lambda char: char.lower() not in chars,
-                lambda i: i == self.location + 1,
-                [(i + self.location + 1, x) for i, x in enumerate(current[self.location + 1:])],
-                len(current)
-            )
-
-        else:
-            scroll_to = Actions.find_next(
-                lambda char: char.lower() not in chars,
-                lambda i: i == self.location - 1,
-                reversed(list(enumerate(current[:self.location]))),
-                0
-            )
-
-        self.location = scroll_to
-
-    def find_next(
-            charset: Callable,
-            trigger: Callable,
-            chars,
-            default: int = 0
-        ) -> int:
-        """
-        Returns the next instance of the specified charset.
-        
-        Arguments:
-            charset: Callable - If condition to satisfy.
-                ex: lambda char: char.lower() not in chars
-            trigger: Callable - Skip condition to meet.
-                ex: lambda i: i == self.location - 1
-            chars: List[Tuple(int, str)] - String to search
-            default: int - Location to return if nothing found
-
-        Returns:
-            location: int - Location found.
-        """
-        skip = False
-        scroll_to = default
-
-        for i, char in chars:
-            if charset(char):
-                if trigger(i):
-                    skip = True
-                    continue
-
-                if skip:
-                    continue
-
-                scroll_to = i
-                break
-
-            elif skip:
-                scroll_to = i
-                break
-
-        return scroll_to
+        self.location = self.get_buffer().word_bound(self.location, direction, is_word)
 
     def scroll_console(
             self,
@@ -425,13 +593,13 @@ class Actions:
         Arguments:
             diff: int - Chars to scroll by.
         """
-        current = self.get_current()
+        length = len(self.get_buffer())
 
         self.location += diff
 
         if diff > 0:
-            if self.location > len(current):
-                self.location = len(current)
+            if self.location > length:
+                self.location = length
 
         elif diff < 0:
             if self.location < 0:
@@ -446,14 +614,12 @@ class Actions:
         Scrolls in the history register.
         """
 
-        current = self.get_current()
+        if self.mode == ConsoleModes.HISTORY:
+            Actions.accept_search(self, char)
 
         if self.hist_current is None:
-            # We need to first append current, if it's not None,
-            # so it's not lost
-
-            if current != "":
-                self.history.append(current)
+            # Hold on to the current line, so it's not lost
+            self.hist_draft = self.get_current()
 
             self.hist_current = len(self.history)
 
@@ -466,13 +632,87 @@ class Actions:
             self.hist_current = None
 
         if self.hist_current is None:
-            self.set_current("")
-            self.location = 0
+            self.set_current(self.hist_draft or "")
+            self.location = len(self.get_buffer())
 
         else:
             # Set to hist index
             self.set_current(str(self.history[self.hist_current]))
-            self.location = len(self.get_current())
+            self.location = len(self.get_buffer())
+
+    def reverse_search(
+            self,
+            char: str
+        ) -> None:
+        """
+        Starts a reverse history search (ctrl + R), or
+        skips to the next older match if one is running.
+        """
+
+        if self.mode == ConsoleModes.REGULAR:
+            self.hist_draft = self.get_current()
+            self.hist_query = None
+            self.hist_match = None
+
+            self.mode = ConsoleModes.HISTORY
+            self.set_current("")
+            self.location = 0
+
+        elif self.mode == ConsoleModes.HISTORY and self.hist_match is not None:
+            match = self.history.search(self.get_current(), self.hist_match)
+
+            if match is not None:
+                self.hist_match = match
+
+    def update_search(
+            self
+        ) -> None:
+        """
+        Finds the most recent match for the reverse search
+        query, if it changed.
+        """
+
+        query = self.get_current()
+
+        if query != self.hist_query:
+            self.hist_query = query
+            self.hist_match = self.history.search(query)
+
+    def accept_search(
+            self,
+            char: str
+        ) -> None:
+        """
+        Ends the reverse search, putting the match
+        in the console.
+        """
+
+        if self.hist_match is not None:
+            text = self.history.get(self.hist_match)
+
+        else:
+            text = self.hist_draft or ""
+
+        self.mode = ConsoleModes.REGULAR
+        self.set_current(text)
+        self.location = len(text)
+        self.hist_current = None
+
+    def cancel_search(
+            self,
+            char: str
+        ) -> None:
+        """
+        Ends the reverse search (ctrl + G or esc), restoring
+        whatever was in the console before.
+        """
+
+        if self.mode != ConsoleModes.HISTORY:
+            return
+
+        self.mode = ConsoleModes.REGULAR
+        self.set_current(self.hist_draft or "")
+        self.location = len(self.get_buffer())
 
     def home(
             self,
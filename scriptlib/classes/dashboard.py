@@ -0,0 +1,305 @@
+"""
+scriptlib.classes.dashboard
+
+Status pane for running tasks, drawn between the
+terminal's title and its logs.
+"""
+
+import contextvars
+import threading
+import time
+from typing import List, Optional
+
+from scriptlib.utils import (
+    exceptions,
+    timeutils
+)
+
+import scriptlib
+
+# Progress handle of the task running in this context, if any
+current = contextvars.ContextVar("progress", default = None)
+
+class Dashboard:
+    """
+    Tracks running tasks and their progress.
+
+    Progress reports only mark the pane as changed. The
+    actual redraw goes through the terminal's render scheduler,
+    so a task reporting thousands of times a second costs
+    about as much as one reporting a few times.
+
+    Safe to report to from other threads (ie: sync tasks
+    running in the thread pool).
+    """
+
+    def __init__(
+            self,
+            limit: int = 5,
+            tick: float = 1.0
+        ) -> None:
+        """
+        Creates an empty dashboard.
+
+        Arguments:
+            limit: int - Max tasks shown at once
+            tick: float - Seconds between elapsed time refreshes
+        """
+
+        self.limit = limit
+        self.tick = tick
+
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        # Whether a redraw has been handed to the loop
+        self.scheduled = False
+        self.tick_handle = None
+
+    @property
+    def rows(self) -> int:
+        """
+        Gets the number of screen lines the pane needs,
+        including its bottom border. 0 when nothing's running.
+        """
+
+        count = min(len(self.entries), self.limit)
+
+        return count + 1 if count > 0 else 0
+
+    def start(
+            self,
+            name: str
+        ) -> "ProgressHandle":
+        """
+        Adds a running task.
+
+        Arguments:
+            name: str - Task name to show
+
+        Returns:
+            handle: ProgressHandle
+        """
+
+        handle = ProgressHandle(self, name)
+
+        with self.lock:
+            self.entries[handle] = None
+
+        self.changed()
+
+        return handle
+
+    def remove(
+            self,
+            handle: "ProgressHandle"
+        ) -> None:
+        """
+        Removes a task. Use ProgressHandle.finish().
+
+        Arguments:
+            handle: ProgressHandle
+        """
+
+        with self.lock:
+            self.entries.pop(handle, None)
+
+        self.changed()
+
+    def changed(
+            self
+        ) -> None:
+        """
+        Schedules a redraw of the pane, unless one already is.
+        """
+
+        with self.lock:
+            if self.scheduled:
+                return
+
+            self.scheduled = True
+
+        scriptlib.loop.call_soon_threadsafe(self.flush)
+
+    def flush(
+            self
+        ) -> None:
+        """
+        Passes a redraw on to the render scheduler. Runs in
+        the loop's thread.
+        """
+
+        with self.lock:
+            self.scheduled = False
+
+        terminal = scriptlib.terminal
+
+        if terminal.dashboard_rows != self.rows:
+            # The log area has to shrink or grow
+            terminal.update_size()
+
+        else:
+            terminal.request_reprint(dashboard = True)
+
+        # Keep elapsed times moving while anything is running
+        if len(self.entries) > 0 and self.tick_handle is None:
+            self.tick_handle = scriptlib.loop.call_later(self.tick, self.refresh)
+
+    def refresh(
+            self
+        ) -> None:
+        """
+        Periodic redraw for elapsed times.
+        """
+
+        self.tick_handle = None
+
+        if len(self.entries) > 0:
+            self.changed()
+
+    def format(
+            self,
+            width: int,
+            count: int
+        ) -> List[List[str]]:
+        """
+        Lays out the pane.
+
+        Arguments:
+            width: int - Columns available
+            count: int - Lines available
+
+        Returns:
+            lines: List[List[str]] - [name, bar, details] for
+                each line. Unused lines are empty.
+        """
+
+        with self.lock:
+            handles = list(self.entries)
+
+        if len(handles) > count:
+            # Last line summarizes the rest
+            shown = handles[:count - 1]
+            extra = len(handles) - len(shown)
+
+        else:
+            shown = handles
+            extra = 0
+
+        name_width = min(max([len(handle.name) for handle in shown] + [0]), width // 3)
+        bar_width = max(min(width // 4, 30), 0)
+
+        lines = []
+        for handle in shown:
+            fraction, note = handle.fraction, handle.note
+
+            details = timeutils.get_duration(time.perf_counter() - handle.started)
+
+            if fraction is None:
+                bar = ""
+
+            else:
+                filled = int(fraction * bar_width)
+                bar = f"{'█' * filled}{'░' * (bar_width - filled)} {int(fraction * 100):>3}%"
+
+            if note:
+                details += f"  {note}"
+
+            name = handle.name[:name_width].ljust(name_width)
+
+            # Whatever doesn't fit is cut from the note
+            details = details[:max(width - name_width - len(bar) - 4, 0)]
+
+            lines.append([name, bar, details])
+
+        if extra > 0:
+            lines.append([f"+ {extra} more", "", ""])
+
+        while len(lines) < count:
+            lines.append(["", "", ""])
+
+        return lines
+
+class ProgressHandle:
+    """
+    A running task's entry on the dashboard.
+
+    Sample:
+        for i, path in enumerate(paths):
+            ...
+            dashboard.report((i + 1) / len(paths), path)
+    """
+
+    def __init__(
+            self,
+            dashboard: Dashboard,
+            name: str
+        ) -> None:
+        """
+        Creates a handle. Use Dashboard.start().
+
+        Arguments:
+            dashboard: Dashboard
+            name: str - Task name to show
+        """
+
+        self.dashboard = dashboard
+        self.name = name
+        self.started = time.perf_counter()
+
+        # None until progress is reported - shown without a bar
+        self.fraction = None
+        self.note = None
+
+    def report(
+            self,
+            fraction: Optional[float] = None,
+            note: Optional[str] = None
+        ) -> None:
+        """
+        Reports progress.
+
+        Arguments:
+            fraction: Optional[float] - Progress from 0 to 1.
+                None leaves it unchanged.
+            note: Optional[str] - Short status text
+        """
+
+        if fraction is not None:
+            if fraction < 0 or fraction > 1:
+                raise exceptions.DevError(f"Progress has to be between 0 and 1, not {fraction}")
+
+            self.fraction = fraction
+
+        if note is not None:
+            self.note = note
+
+        self.dashboard.changed()
+
+    def finish(
+            self
+        ) -> None:
+        """
+        Removes the task from the dashboard.
+        """
+
+        self.dashboard.remove(self)
+
+def report(
+        fraction: Optional[float] = None,
+        note: Optional[str] = None
+    ) -> None:
+    """
+    Reports progress for the task running in this context.
+    Does nothing outside of a task, so functions can report
+    whether or not they're run as one.
+
+    Arguments:
+        fraction: Optional[float] - Progress from 0 to 1
+        note: Optional[str] - Short status text
+    """
+
+    handle = current.get()
+
+    if handle is not None:
+        handle.report(fraction, note)
@@ -0,0 +1,269 @@
+"""
+scriptlib.classes.gapbuffer
+
+Text buffer used for the console's input line.
+"""
+
+from typing import Callable
+
+class GapBuffer:
+    """
+    A gap buffer: the text is stored in one list with
+    an empty "gap" at the cursor. Inserting or deleting at the
+    cursor only touches the gap, so typing (or pasting huge
+    strings) is amortized O(1) per character instead of
+    rebuilding the whole string every keystroke.
+    """
+
+    def __init__(
+            self,
+            text: str = "",
+            capacity: int = 64
+        ) -> None:
+        """
+        Creates a buffer.
+
+        Arguments:
+            text: str - Initial text
+            capacity: int - Initial gap size
+        """
+
+        self.buf = [""] * capacity
+        self.gap_start = 0
+        self.gap_end = capacity
+
+        if text:
+            self.insert(0, text)
+
+    def __len__(
+            self
+        ) -> int:
+        return len(self.buf) - (self.gap_end - self.gap_start)
+
+    def __str__(
+            self
+        ) -> str:
+        return self.slice(0, len(self))
+
+    def __eq__(
+            self,
+            other
+        ) -> bool:
+        if type(other) == str:
+            return len(self) == len(other) and str(self) == other
+
+        return NotImplemented
+
+    def char(
+            self,
+            index: int
+        ) -> str:
+        """
+        Gets the character at an index.
+
+        Arguments:
+            index: int - Index in the text
+        """
+
+        if index < 0 or index >= len(self):
+            raise IndexError("Buffer index out of range")
+
+        if index < self.gap_start:
+            return self.buf[index]
+
+        return self.buf[index + self.gap_end - self.gap_start]
+
+    def slice(
+            self,
+            start: int,
+            end: int
+        ) -> str:
+        """
+        Gets a section of the text, without joining
+        anything outside of it.
+
+        Arguments:
+            start: int - Start index
+            end: int - End index (exclusive)
+        """
+
+        start = max(0, start)
+        end = min(len(self), end)
+
+        if start >= end:
+            return ""
+
+        gap = self.gap_end - self.gap_start
+
+        if end <= self.gap_start:
+            return "".join(self.buf[start:end])
+
+        if start >= self.gap_start:
+            return "".join(self.buf[start + gap:end + gap])
+
+        return "".join(self.buf[start:self.gap_start]) + "".join(self.buf[self.gap_end:end + gap])
+
+    def move_gap(
+            self,
+            index: int
+        ) -> None:
+        """
+        Moves the gap to an index. Costs the distance
+        moved, which is tiny for normal cursor movement.
+
+        Arguments:
+            index: int - Index to move to
+        """
+
+        if index < self.gap_start:
+            count = self.gap_start - index
+            self.buf[self.gap_end - count:self.gap_end] = self.buf[index:self.gap_start]
+
+            self.gap_start -= count
+            self.gap_end -= count
+
+        elif index > self.gap_start:
+            count = index - self.gap_start
+            self.buf[self.gap_start:self.gap_start + count] = self.buf[self.gap_end:self.gap_end + count]
+
+            self.gap_start += count
+            self.gap_end += count
+
+    def grow(
+            self,
+            needed: int
+        ) -> None:
+        """
+        Makes sure the gap can hold at least 'needed' characters.
+        Doubles the buffer size, so growing is amortized.
+
+        Arguments:
+            needed: int - Required gap size
+        """
+
+        gap = self.gap_end - self.gap_start
+
+        if gap >= needed:
+            return
+
+        extra = max(needed - gap, len(self.buf))
+
+        self.buf[self.gap_end:self.gap_end] = [""] * extra
+        self.gap_end += extra
+
+    def insert(
+            self,
+            index: int,
+            text: str
+        ) -> None:
+        """
+        Inserts text at an index.
+
+        Arguments:
+            index: int - Index to insert before
+            text: str - Text to insert
+        """
+
+        self.move_gap(index)
+        self.grow(len(text))
+
+        self.buf[self.gap_start:self.gap_start + len(text)] = text
+        self.gap_start += len(text)
+
+    def delete(
+            self,
+            start: int,
+            end: int
+        ) -> None:
+        """
+        Deletes a range of text.
+
+        Arguments:
+            start: int - Start index
+            end: int - End index (exclusive)
+        """
+
+        start = max(0, start)
+        end = min(len(self), end)
+
+        if start >= end:
+            return
+
+        self.move_gap(start)
+        self.gap_end += end - start
+
+    def set(
+            self,
+            text: str
+        ) -> None:
+        """
+        Replaces all the text in the buffer.
+
+        Arguments:
+            text: str - New text
+        """
+
+        self.buf = [""] * max(64, len(text) * 2)
+        self.gap_start = 0
+        self.gap_end = len(self.buf)
+
+        self.insert(0, text)
+
+    def find(
+            self,
+            start: int,
+            direction: int,
+            condition: Callable
+        ) -> int:
+        """
+        Scans from an index until a character satisfies
+        a condition.
+
+        Arguments:
+            start: int - Index to start at. When moving
+                backwards, the scan starts at start - 1.
+            direction: int - 1 for forward, -1 for backward
+            condition: Callable - Stop when this returns True
+
+        Returns:
+            index: int - Location (cursor position) found.
+                The end (or start) of the text if nothing matched.
+        """
+
+        if direction > 0:
+            i = start
+
+            while i < len(self) and not condition(self.char(i)):
+                i += 1
+
+            return i
+
+        i = start
+
+        while i > 0 and not condition(self.char(i - 1)):
+            i -= 1
+
+        return i
+
+    def word_bound(
+            self,
+            start: int,
+            direction: int,
+            is_word: Callable
+        ) -> int:
+        """
+        Finds the next word boundary (ie: ctrl + arrow).
+        Skips any separators, then the word after them.
+
+        Arguments:
+            start: int - Cursor position to start at
+            direction: int - 1 for forward, -1 for backward
+            is_word: Callable - Returns True for word characters
+
+        Returns:
+            index: int - Cursor position of the boundary
+        """
+
+        index = self.find(start, direction, is_word)
+
+        return self.find(index, direction, lambda char: not is_word(char))
\ No newline at end of file
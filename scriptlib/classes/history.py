@@ -0,0 +1,329 @@
+"""
+scriptlib.classes.history
+
+Persistent, deduplicated history for the integrated console.
+"""
+
+import bisect
+import json
+import os
+from typing import Optional
+
+from scriptlib.utils import (
+    fileutils,
+    strutils
+)
+
+import scriptlib
+
+class History:
+    """
+    Console history register.
+
+    Entries are deduplicated (re-running something moves it to
+    the end), capped at a maximum size, and persisted to a
+    per-script file. The file is only read on first use.
+
+    Every entry is indexed by its trigrams, so reverse
+    searches don't have to scan the entire history.
+    """
+
+    def __init__(
+            self,
+            size: Optional[int] = None,
+            path: Optional[str] = None
+        ) -> None:
+        """
+        Creates a history register. Nothing is loaded
+        until it's actually used.
+
+        Arguments:
+            size: Optional[int] - Max entries. Defaults to
+                the history_size config option.
+            path: Optional[str] - File to persist to. Defaults to
+                ~/.local/share/scriptlib/[script name].history
+        """
+
+        self.size = size
+        self.path = path
+
+        self.loaded = False
+
+        # Entry ID -> text
+        self.entries = {}
+        # Text -> entry ID, to deduplicate
+        self.ids = {}
+        # Sorted list of live entry IDs (oldest first)
+        self.order = []
+        self.next_id = 0
+
+        # Trigram -> set of entry IDs
+        self.trigrams = {}
+
+        # Lines in the file, to know when to compact it
+        self.file_lines = 0
+
+    def load(
+            self
+        ) -> None:
+        """
+        Resolves settings and reads the history file,
+        if that hasn't been done yet.
+        """
+
+        if self.loaded:
+            return
+
+        self.loaded = True
+
+        config = getattr(scriptlib.script, "config", None)
+
+        if self.size is None:
+            self.size = getattr(config, "history_size", 1000)
+
+        if self.path is None and self.size > 0:
+            name = strutils.get_slug(getattr(scriptlib.script, "name", "")) or "scriptlib"
+            self.path = os.path.join(os.path.expanduser("~"), ".local", "share", "scriptlib", f"{name}.history")
+
+        if self.path is None or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    self.file_lines += 1
+
+                    try:
+                        self.add(json.loads(line), persist = False)
+
+                    except ValueError:
+                        continue
+
+        except OSError:
+            return
+
+        # Rewrite the file if it's mostly duplicates or evicted entries
+        if self.file_lines > len(self.order) * 2:
+            self.compact()
+
+    def add(
+            self,
+            text: str,
+            persist: bool = True
+        ) -> None:
+        """
+        Adds an entry, moving it to the end if it
+        already exists.
+
+        Arguments:
+            text: str - Entry to add
+            persist: bool - Append it to the history file
+        """
+
+        self.load()
+
+        if text.strip() == "" or self.size == 0:
+            return
+
+        if text in self.ids:
+            self.remove(self.ids[text])
+
+        entry_id = self.next_id
+        self.next_id += 1
+
+        self.entries[entry_id] = text
+        self.ids[text] = entry_id
+        self.order.append(entry_id)
+
+        for trigram in get_trigrams(text):
+            if trigram not in self.trigrams:
+                self.trigrams[trigram] = set()
+
+            self.trigrams[trigram].add(entry_id)
+
+        # Evict the oldest entries
+        while len(self.order) > self.size:
+            self.remove(self.order[0])
+
+        if persist:
+            self.write(text)
+
+    def remove(
+            self,
+            entry_id: int
+        ) -> None:
+        """
+        Removes an entry.
+
+        Arguments:
+            entry_id: int - ID of the entry
+        """
+
+        text = self.entries.pop(entry_id)
+        del self.ids[text]
+
+        del self.order[bisect.bisect_left(self.order, entry_id)]
+
+        for trigram in get_trigrams(text):
+            ids = self.trigrams[trigram]
+            ids.discard(entry_id)
+
+            if len(ids) == 0:
+                del self.trigrams[trigram]
+
+    def write(
+            self,
+            text: str
+        ) -> None:
+        """
+        Appends an entry to the history file.
+
+        Arguments:
+            text: str - Entry to write
+        """
+
+        if self.path is None:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok = True)
+
+            with open(self.path, "a") as f:
+                f.write(json.dumps(text) + "\n")
+
+            self.file_lines += 1
+
+        except OSError:
+            # History is a convenience - don't break the console over it
+            return
+
+        if self.file_lines > self.size * 2:
+            self.compact()
+
+    def compact(
+            self
+        ) -> None:
+        """
+        Rewrites the history file with only the live
+        entries.
+        """
+
+        if self.path is None:
+            return
+
+        try:
+            fileutils.write_atomic(
+                self.path,
+                "".join(json.dumps(self.entries[entry_id]) + "\n" for entry_id in self.order)
+            )
+
+        except OSError:
+            return
+
+        self.file_lines = len(self.order)
+
+    def search(
+            self,
+            query: str,
+            before: Optional[int] = None
+        ) -> Optional[int]:
+        """
+        Finds the most recent entry containing a query.
+
+        Arguments:
+            query: str - Text to look for
+            before: Optional[int] - Only look at entries older
+                than this ID (to find the next match)
+
+        Returns:
+            entry_id: Optional[int] - ID of the match
+        """
+
+        self.load()
+
+        if before is None:
+            before = self.next_id
+
+        if query == "":
+            i = bisect.bisect_left(self.order, before) - 1
+            return self.order[i] if i >= 0 else None
+
+        trigrams = get_trigrams(query)
+
+        if len(trigrams) == 0:
+            # Too short to use the index - walk backwards
+            for i in range(bisect.bisect_left(self.order, before) - 1, -1, -1):
+                if query in self.entries[self.order[i]]:
+                    return self.order[i]
+
+            return None
+
+        # Candidates must contain every trigram of the query
+        sets = []
+        for trigram in trigrams:
+            if trigram not in self.trigrams:
+                return None
+
+            sets.append(self.trigrams[trigram])
+
+        sets.sort(key = len)
+        candidates = set.intersection(*sets)
+
+        for entry_id in sorted(candidates, reverse = True):
+            if entry_id < before and query in self.entries[entry_id]:
+                return entry_id
+
+        return None
+
+    def position(
+            self,
+            entry_id: int
+        ) -> int:
+        """
+        Gets the position of an entry in the history.
+
+        Arguments:
+            entry_id: int - ID of the entry
+        """
+
+        return bisect.bisect_left(self.order, entry_id)
+
+    def get(
+            self,
+            entry_id: int
+        ) -> str:
+        """
+        Gets an entry's text by its ID.
+
+        Arguments:
+            entry_id: int - ID of the entry
+        """
+
+        return self.entries[entry_id]
+
+    def __len__(
+            self
+        ) -> int:
+        self.load()
+
+        return len(self.order)
+
+    def __getitem__(
+            self,
+            index: int
+        ) -> str:
+        self.load()
+
+        return self.entries[self.order[index]]
+
+def get_trigrams(
+        text: str
+    ) -> set:
+    """
+    Gets every 3-character sequence in a string.
+
+    Arguments:
+        text: str
+    """
+
+    return {text[i:i + 3] for i in range(len(text) - 2)}
\ No newline at end of file
@@ -58,7 +58,8 @@ class Logger:
             "debug": True,
             "menu": True,
             "script": True,
-            "subscript": True
+            "subscript": True,
+            "console": True
         }
 
         self.format = {
@@ -304,7 +305,8 @@ class Logger:
             bold: bool = False,
             reversed: bool = False,
             color: Optional[str] = None,
-            placeholder_ext: dict = {}
+            placeholder_ext: dict = {},
+            update: bool = True
         ) -> None:
         """
         Internal function to log a message of specific type.
@@ -320,6 +322,7 @@ class Logger:
             reversed: bool = False
             color: str = None
             placeholder_ext: dict = {}
+            update: bool = True - Redraw immediately
         """
 
         # Make sure we should log this
@@ -368,5 +371,7 @@ class Logger:
 
         scriptlib.terminal.log(
             msg,
-            True
+            update = update,
+            category = category,
+            log_type = log_type
         )
\ No newline at end of file
@@ -0,0 +1,245 @@
+"""
+scriptlib.classes.logstore
+
+Disk-backed storage for the terminal's log lines,
+so scrollback is limited by disk space instead of memory.
+"""
+
+import mmap
+import tempfile
+import threading
+from array import array
+from typing import List, Union
+
+class LogStore:
+    """
+    Append-only log line store. Only the last line can
+    be changed.
+
+    Lines are written to an anonymous temp file and read
+    back through mmap, using an in-memory index of line offsets.
+    Only the lines that are actually requested get decoded,
+    so the terminal can scroll through millions of lines
+    without holding them all in memory.
+
+    Supports len(), indexing, and iteration like a list.
+    """
+
+    def __init__(
+            self,
+            flush_size: int = 65536
+        ) -> None:
+        """
+        Creates a new, empty store.
+
+        Arguments:
+            flush_size: int - Bytes to buffer before writing to disk
+        """
+
+        self.file = tempfile.TemporaryFile()
+
+        # offsets[i] is where line i starts; offsets[-1] is the end of all data
+        self.offsets = array("Q", [0])
+
+        # Lines appended since the last flush
+        self.pending = []
+        self.pending_bytes = 0
+        self.written = 0
+        self.flush_size = flush_size
+
+        self.map = None
+        self.mapped = 0
+
+        # Both the console thread and the event loop log & draw
+        self.lock = threading.RLock()
+
+    def append(
+            self,
+            line: str
+        ) -> int:
+        """
+        Adds a line to the end of the store.
+
+        Arguments:
+            line: str - Line to add
+
+        Returns:
+            index: int - Index of the new line
+        """
+
+        data = line.encode("utf-8", "replace")
+
+        with self.lock:
+            self.pending.append(data)
+            self.pending_bytes += len(data)
+            self.offsets.append(self.offsets[-1] + len(data))
+
+            if self.pending_bytes >= self.flush_size:
+                self.flush()
+
+            return len(self) - 1
+
+    def replace_last(
+            self,
+            line: str
+        ) -> None:
+        """
+        Replaces the last line - ie: for progress bars that
+        redraw themselves with carriage returns.
+
+        Arguments:
+            line: str - New contents of the line
+        """
+
+        data = line.encode("utf-8", "replace")
+
+        with self.lock:
+            if len(self) == 0:
+                self.append(line)
+                return
+
+            index = len(self) - 1
+
+            if index >= self.written:
+                # Still in memory
+                self.pending_bytes += len(data) - len(self.pending[-1])
+                self.pending[-1] = data
+                self.offsets[-1] = self.offsets[-2] + len(data)
+                return
+
+            # Already on disk - cut it off the end of the file and
+            # add it again. The map can't outlive the truncate.
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+                self.mapped = 0
+
+            self.file.truncate(self.offsets[index])
+            self.file.seek(self.offsets[index])
+
+            self.offsets.pop()
+            self.written -= 1
+
+            self.append(line)
+
+    def flush(
+            self
+        ) -> None:
+        """
+        Writes all pending lines to disk.
+        """
+
+        with self.lock:
+            if len(self.pending) == 0:
+                return
+
+            self.file.write(b"".join(self.pending))
+            self.file.flush()
+
+            self.written += len(self.pending)
+            self.pending = []
+            self.pending_bytes = 0
+
+    def get(
+            self,
+            index: int
+        ) -> str:
+        """
+        Reads a single line.
+
+        Arguments:
+            index: int - Line index
+
+        Returns:
+            line: str
+        """
+
+        with self.lock:
+            if index < 0:
+                index += len(self)
+
+            if index < 0 or index >= len(self):
+                raise IndexError("Log line index out of range")
+
+            # Not on disk yet
+            if index >= self.written:
+                return self.pending[index - self.written].decode("utf-8", "replace")
+
+            start, end = self.offsets[index], self.offsets[index + 1]
+
+            if start == end:
+                return ""
+
+            # Remap if the file has grown past what we've mapped
+            if end > self.mapped:
+                self.remap()
+
+            return self.map[start:end].decode("utf-8", "replace")
+
+    def window(
+            self,
+            start: int,
+            count: int
+        ) -> List[str]:
+        """
+        Reads a range of lines - ie: what's visible on screen.
+
+        Arguments:
+            start: int - First line index
+            count: int - Max number of lines to read
+
+        Returns:
+            lines: List[str]
+        """
+
+        with self.lock:
+            end = min(start + count, len(self))
+
+            return [self.get(i) for i in range(max(start, 0), end)]
+
+    def remap(
+            self
+        ) -> None:
+        """
+        Maps everything that's been written so far.
+        """
+
+        if self.map is not None:
+            self.map.close()
+
+        self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        self.mapped = len(self.map)
+
+    def close(
+            self
+        ) -> None:
+        """
+        Closes the store. The backing file is deleted.
+        """
+
+        with self.lock:
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+
+            self.file.close()
+
+    def __len__(
+            self
+        ) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(
+            self,
+            index: Union[int, slice]
+        ) -> Union[str, List[str]]:
+        if type(index) == slice:
+            return [self.get(i) for i in range(*index.indices(len(self)))]
+
+        return self.get(index)
+
+    def __iter__(
+            self
+        ):
+        for i in range(len(self)):
+            yield self.get(i)
\ No newline at end of file
@@ -4,7 +4,10 @@ scriptlib.classes.script
 Contains the base script class, which does everything.
 """
 
+import asyncio
+import heapq
 import sys
+import time
 import pytz
 
 from scriptlib.utils import (
@@ -83,6 +86,15 @@ class Script:
         await self.verify_start()
         self.logger.prep()
 
+        self.register_commands()
+
+        if self.config.stall_warning_ms > 0:
+            scriptlib.loop.create_task(
+                errorhandler.wrap(
+                    self.watch_stalls(self.config.stall_warning_ms)
+                )
+            )
+
     async def debug(
             self
         ) -> None:
@@ -115,17 +127,226 @@ class Script:
         if version[0] != 3 and version[1] < 6:
             raise exceptions.InitError(f"You're not running Python 3.6 or higher, which is required for this script. Run `python3 updater.py` (maybe) to install it.")
 
-    async def run(
+    async def watch_stalls(
+            self,
+            threshold: int
+        ) -> None:
+        """
+        Logs a debug warning whenever the event loop is
+        blocked for longer than a threshold (say, by a sync
+        call in a coroutine).
+
+        Arguments:
+            threshold: int - Milliseconds before it counts as a stall
+        """
+
+        interval = threshold / 2000
+
+        while True:
+            expected = scriptlib.loop.time() + interval
+
+            await asyncio.sleep(interval)
+
+            # However late the wakeup was, the loop was busy
+            stall = (scriptlib.loop.time() - expected) * 1000
+
+            if stall >= threshold:
+                self.logger.log("warn", "debug", f"Event loop stalled for {round(stall)}ms")
+
+    def register_commands(
             self
         ) -> None:
         """
-        Runs the script.
+        Registers the script's console commands.
         """
 
-        # Just tell each script to start
-        for script in self.scripts:
-            if script.auto_run:
-                scriptlib.loop.create_task(errorhandler.wrap(script.start()))
+        self.commands = scriptlib.terminal.console.commands
+
+        self.commands.register(
+            "scripts",
+            self.list_scripts,
+            "Lists all subscripts."
+        )
+
+        if len(self.scripts) > 0:
+            self.commands.register(
+                "run",
+                self.run_script,
+                "Runs a subscript by number (see 'scripts').",
+                args = [
+                    ("number", f"int[between(1,{len(self.scripts)})]")
+                ]
+            )
+
+    async def list_scripts(
+            self
+        ) -> None:
+        """
+        Logs every registered subscript.
+        """
+
+        self.logger.log("info", "console", "Subscripts:", bold = True)
+
+        for i, script in enumerate(self.scripts):
+            self.logger.log_step("info", "console", f"{i + 1} | {script.name} | {script.description}")
+
+    async def run_script(
+            self,
+            number: int
+        ) -> None:
+        """
+        Runs a subscript from the console.
+
+        Arguments:
+            number: int - 1-indexed subscript number
+        """
+
+        script = self.scripts[number - 1]
+
+        self.logger.log("start", "console", f"Running script {number}: {script.name}")
+
+        await errorhandler.wrap(
+            script.start()
+        )
+
+    async def run(
+            self
+        ) -> int:
+        """
+        Runs the script's auto-run subscripts and waits
+        for them to finish.
+
+        Subscripts start in order of priority (highest first,
+        then in the order they were registered), with at most
+        max_concurrent_scripts running at once. Each one's
+        status is kept in self.runs.
+
+        If a subscript raises CloseLoop (or this is cancelled),
+        the others are cancelled, and given grace_period seconds
+        to clean up before it's passed on.
+
+        Returns:
+            exit_code: int - See get_exit_code()
+        """
+
+        self.runs = {}
+        self.exit_code = None
 
         if len(self.scripts) == 0:
-            self.logger.log("warn", "init", "No scripts are registered. Doing nothing.")
\ No newline at end of file
+            self.logger.log("warn", "init", "No scripts are registered. Doing nothing.")
+
+        queue = []
+        for i, script in enumerate(self.scripts):
+            if not script.auto_run:
+                continue
+
+            self.runs[script] = {
+                "name": script.name,
+                "priority": script.priority,
+                "status": "queued",
+                "task": None,
+                "started": None,
+                "finished": None
+            }
+
+            queue.append((-script.priority, i, script))
+
+        heapq.heapify(queue)
+
+        limit = self.config.max_concurrent_scripts or len(queue)
+        running = {}
+
+        try:
+            while queue or running:
+                while queue and len(running) < limit:
+                    _, _, script = heapq.heappop(queue)
+
+                    task = scriptlib.loop.create_task(errorhandler.wrap(script.start()))
+                    running[task] = script
+
+                    self.runs[script].update(
+                        status = "running",
+                        task = task,
+                        started = time.time()
+                    )
+
+                done, _ = await asyncio.wait(running, return_when = asyncio.FIRST_COMPLETED)
+
+                close = None
+
+                for task in done:
+                    script = running.pop(task)
+                    run = self.runs[script]
+
+                    run["finished"] = time.time()
+
+                    try:
+                        success = task.result()
+
+                    except exceptions.CloseLoop as e:
+                        # Passed on once everything else that's
+                        # done is recorded
+                        close = e
+                        run["status"] = "cancelled"
+                        continue
+
+                    run["status"] = "success" if success and not script.failed else "failed"
+
+                if close is not None:
+                    raise close
+
+        except (exceptions.CloseLoop, asyncio.CancelledError):
+            await self.cancel_runs(running)
+            raise
+
+        finally:
+            self.exit_code = self.get_exit_code()
+
+        return self.exit_code
+
+    async def cancel_runs(
+            self,
+            running: dict
+        ) -> None:
+        """
+        Cancels running subscripts, and marks everything
+        that hasn't finished as cancelled.
+
+        Arguments:
+            running: dict - Running tasks -> their subscripts
+        """
+
+        for task in running:
+            task.cancel()
+
+        if len(running) > 0:
+            self.logger.log("stop", "shutdown", f"Cancelling {len(running)} running subscript(s).")
+
+            # Let them clean up, but not forever
+            await asyncio.wait(running, timeout = self.config.grace_period)
+
+        for run in self.runs.values():
+            if run["status"] in ["queued", "running"]:
+                run["status"] = "cancelled"
+                run["finished"] = time.time()
+
+    def get_exit_code(
+            self
+        ) -> int:
+        """
+        Gets the script's exit code from its subscripts' statuses.
+
+        Returns:
+            exit_code: int - 0 if everything succeeded, 1 if
+                anything failed, 130 if anything was cancelled
+        """
+
+        statuses = [run["status"] for run in getattr(self, "runs", {}).values()]
+
+        if "failed" in statuses:
+            return 1
+
+        if "cancelled" in statuses:
+            return 130
+
+        return 0
\ No newline at end of file
@@ -0,0 +1,377 @@
+"""
+scriptlib.classes.search
+
+Maintains a searchable index over the terminal's
+log lines, so matches can be found without rescanning
+everything that's been logged.
+"""
+
+import bisect
+import re
+from array import array
+from typing import Optional, List
+
+# Splits stripped log lines into searchable words.
+word_regex = re.compile(r"\w+")
+
+class LogIndex:
+    """
+    Incrementally maintained index over stored log lines.
+
+    Every line is indexed by its (ANSI-stripped) words,
+    its category, and its log type. Lines are referenced by
+    their absolute line number, so the index keeps working
+    when older lines are dropped from the store - call
+    trim() with the first line that's still stored.
+
+    The log store is on disk, but posting lists are in memory,
+    so only the last 'limit' lines are kept searchable.
+    """
+
+    def __init__(
+            self,
+            limit: int = 250000
+        ) -> None:
+        """
+        Creates an empty index.
+
+        Arguments:
+            limit: int - Max lines kept searchable
+        """
+
+        self.limit = limit
+
+        # Posting lists: key -> ascending absolute line numbers
+        self.words = {}
+        self.categories = {}
+        self.log_types = {}
+
+        # First line number still available in the log store
+        self.first = 0
+        self.count = 0
+
+        # Value of first at the last compaction
+        self.compacted = 0
+
+        # Active query & its sorted matches
+        self.query = None
+        self.matches = array("q")
+
+    def add(
+            self,
+            line: int,
+            text: str,
+            category: Optional[str] = None,
+            log_type: Optional[str] = None
+        ) -> None:
+        """
+        Indexes a new line. Lines must be added in
+        ascending order.
+
+        Arguments:
+            line: int - Absolute line number
+            text: str - ANSI-stripped line text
+            category: Optional[str] - Logger category
+            log_type: Optional[str] - Logger log type
+        """
+
+        words = set(word_regex.findall(text.lower()))
+
+        for word in words:
+            self.post(self.words, word, line)
+
+        if category is not None:
+            self.post(self.categories, category.lower(), line)
+
+        if log_type is not None:
+            self.post(self.log_types, log_type.lower(), line)
+
+        self.count = line + 1
+
+        # Keep the active query's matches up to date
+        if self.query is not None:
+            if self.query.match(words, category, log_type):
+                self.matches.append(line)
+
+        if self.count - self.first > self.limit:
+            self.trim(self.count - self.limit)
+
+    def post(
+            self,
+            postings: dict,
+            key: str,
+            line: int
+        ) -> None:
+        """
+        Appends a line number to a posting list.
+
+        Arguments:
+            postings: dict - Posting list dict to add to
+            key: str - Key to post under
+            line: int - Line number
+        """
+
+        if key not in postings:
+            postings[key] = array("q")
+
+        postings[key].append(line)
+
+    def trim(
+            self,
+            first: int
+        ) -> None:
+        """
+        Marks every line before 'first' as no longer
+        stored. Stale entries are skipped during lookups,
+        and compacted away once they make up most of the index.
+
+        Arguments:
+            first: int - First line still stored
+        """
+
+        if first <= self.first:
+            return
+
+        self.first = first
+
+        # Compact once stale entries outnumber live ones
+        if self.first - self.compacted > self.count - self.first:
+            self.compact()
+
+    def compact(
+            self
+        ) -> None:
+        """
+        Drops all stale entries from the posting lists.
+        """
+
+        for postings in [self.words, self.categories, self.log_types]:
+            for key in list(postings):
+                lines = postings[key]
+                start = bisect.bisect_left(lines, self.first)
+
+                if start == len(lines):
+                    del postings[key]
+
+                elif start > 0:
+                    postings[key] = lines[start:]
+
+        self.matches = self.matches[bisect.bisect_left(self.matches, self.first):]
+
+        self.compacted = self.first
+
+    def search(
+            self,
+            query: str
+        ) -> int:
+        """
+        Sets the active query and collects its matches.
+
+        Query format: any number of words, plus optional
+        'category:name' and 'type:name' filters. A line
+        matches if it contains every word and passes every filter.
+
+        Arguments:
+            query: str - Query to search for
+
+        Returns:
+            matches: int - Number of matching lines
+        """
+
+        self.query = Query(query)
+
+        # Intersect the posting lists, starting with the shortest
+        lists = self.query.postings(self)
+
+        if lists is None:
+            self.matches = array("q")
+            return 0
+
+        lists.sort(key = len)
+
+        shortest, rest = lists[0], lists[1:]
+
+        self.matches = array(
+            "q",
+            (
+                line for line in shortest[bisect.bisect_left(shortest, self.first):]
+                if all(contains(other, line) for other in rest)
+            )
+        )
+
+        return len(self.matches)
+
+    def clear(
+            self
+        ) -> None:
+        """
+        Clears the active query.
+        """
+
+        self.query = None
+        self.matches = array("q")
+
+    def live_matches(
+            self
+        ) -> int:
+        """
+        Returns the number of matches that are still stored.
+        """
+
+        return len(self.matches) - bisect.bisect_left(self.matches, self.first)
+
+    def next_match(
+            self,
+            line: int,
+            direction: int = 1
+        ) -> Optional[int]:
+        """
+        Finds the next match after (or before) a line.
+        Wraps around if nothing is found.
+
+        Arguments:
+            line: int - Line to start from (exclusive)
+            direction: int - 1 for forward, -1 for backward
+
+        Returns:
+            match: Optional[int] - Line number, or None if
+                there are no matches
+        """
+
+        start = bisect.bisect_left(self.matches, self.first)
+
+        if start == len(self.matches):
+            return None
+
+        if direction > 0:
+            i = bisect.bisect_right(self.matches, line)
+
+            if i == len(self.matches):
+                i = start # Wrap to first
+
+        else:
+            i = bisect.bisect_left(self.matches, line) - 1
+
+            if i < start:
+                i = len(self.matches) - 1 # Wrap to last
+
+        return self.matches[i]
+
+    def position(
+            self,
+            line: int
+        ) -> int:
+        """
+        Returns the 1-indexed position of a match among
+        all stored matches.
+
+        Arguments:
+            line: int - Matching line number
+        """
+
+        return bisect.bisect_left(self.matches, line) - bisect.bisect_left(self.matches, self.first) + 1
+
+class Query:
+    """
+    A parsed log search query.
+    """
+
+    def __init__(
+            self,
+            query: str
+        ) -> None:
+        """
+        Parses a query string.
+
+        Arguments:
+            query: str - Query to parse
+        """
+
+        self.words = []
+        self.category = None
+        self.log_type = None
+
+        for part in query.lower().split():
+            if part.startswith("category:") or part.startswith("cat:"):
+                self.category = part.split(":", 1)[1]
+
+            elif part.startswith("type:"):
+                self.log_type = part.split(":", 1)[1]
+
+            else:
+                self.words += word_regex.findall(part)
+
+    def postings(
+            self,
+            index: LogIndex
+        ) -> Optional[List[array]]:
+        """
+        Gets every posting list this query has to intersect.
+
+        Arguments:
+            index: LogIndex - Index to look in
+
+        Returns:
+            postings: Optional[list] - Posting lists, or None if
+                some part of the query can never match
+        """
+
+        lists = []
+
+        for postings, keys in [
+                (index.words, self.words),
+                (index.categories, [self.category] if self.category else []),
+                (index.log_types, [self.log_type] if self.log_type else [])
+            ]:
+            for key in keys:
+                if key not in postings:
+                    return None
+
+                lists.append(postings[key])
+
+        if len(lists) == 0:
+            return None
+
+        return lists
+
+    def match(
+            self,
+            words: set,
+            category: Optional[str],
+            log_type: Optional[str]
+        ) -> bool:
+        """
+        Checks if a single new line matches this query.
+
+        Arguments:
+            words: set - Lowercase words in the line
+            category: Optional[str]
+            log_type: Optional[str]
+        """
+
+        if self.category and (category or "").lower() != self.category:
+            return False
+
+        if self.log_type and (log_type or "").lower() != self.log_type:
+            return False
+
+        if len(self.words) == 0 and not (self.category or self.log_type):
+            return False
+
+        return all(word in words for word in self.words)
+
+def contains(
+        lines: array,
+        line: int
+    ) -> bool:
+    """
+    Checks if a sorted posting list contains a line.
+
+    Arguments:
+        lines: array - Sorted line numbers
+        line: int - Line to look for
+    """
+
+    i = bisect.bisect_left(lines, line)
+
+    return i < len(lines) and lines[i] == line
\ No newline at end of file
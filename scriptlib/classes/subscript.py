@@ -8,6 +8,8 @@ from scriptlib.utils import (
     exceptions
 )
 
+import scriptlib
+
 class SubscriptTypes(Enum):
     NONE = 0
 
@@ -24,6 +26,8 @@ class Subscript:
         self.description
         self.type
         self.auto_run
+        self.priority
+        self.failed
 
         async self.run()
         etc.
@@ -38,7 +42,8 @@ class Subscript:
             name: str = "A script",
             description: str = "If you see this, whoever made this script is lazy and didn't edit the description. SHAME!",
             script_type: SubscriptTypes = SubscriptTypes.NONE,
-            run: bool = True
+            run: bool = True,
+            priority: int = 0
         ) -> None:
         """
         Initializes a Subscript class.
@@ -54,6 +59,8 @@ class Subscript:
             description: str
             script_type: scriptlib.classes.subscript.SubscriptTypes (Enum)
             run: bool
+            priority: int - Auto-run subscripts with a higher
+                priority are started first
         """
 
         self.name = name
@@ -62,6 +69,31 @@ class Subscript:
         self.type = script_type
 
         self.auto_run = run
+        self.priority = priority
+
+        # Set by run() if it failed without raising
+        self.failed = False
+
+    def register_command(
+            self,
+            *args,
+            **kwargs
+        ) -> None:
+        """
+        Registers a console command.
+        Shortcut to scriptlib.terminal.console.commands.register().
+
+        Arguments:
+            name: str
+            function: Callable - Async function
+            description: str
+            args: List[Tuple[str, str]] - Argument names & rules
+        """
+
+        scriptlib.terminal.console.commands.register(
+            *args,
+            **kwargs
+        )
 
     async def start(
             self
@@ -70,6 +102,8 @@ class Subscript:
         Starts the script.
         """
 
+        self.failed = False
+
         await self.run()
 
     async def run(
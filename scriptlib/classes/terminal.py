@@ -3,15 +3,25 @@ import blessed
 import os
 import signal
 import re
+import sys
 from typing import Optional, List
 import termios
 import tty
 import asyncio
 
 from scriptlib.utils import (
-    colors
+    colors,
+    errorhandler
 )
 
+from scriptlib.classes import (
+    search,
+    logstore,
+    dashboard
+)
+
+import scriptlib
+
 
 ansi_escape = re.compile(r'''
     \x1B  # ESC
@@ -54,15 +64,33 @@ class Terminal:
         tty.setcbreak(self.term._keyboard_fd, termios.TCSANOW)
         print(self.term.enter_fullscreen + self.term.home + self.term.clear)
 
-        self.lines = []
+        self.lines = logstore.LogStore()
         self.title = "Test"
         self.line_numbers = True
         self.disable_log = False
         self.ask_mode = {}
+        self.menu_mode = {}
 
         self.location = 0
         self.manual_scroll = False
 
+        # Batched redraws (see request_reprint)
+        self.render_interval = 0.05
+        self.render_pending = {}
+        self.render_handle = None
+
+        # Log search
+        self.index = search.LogIndex()
+        self.search_line = None
+        self.search_status = None
+
+        # Called with (columns, rows) of the log area on resize
+        self.resize_listeners = []
+
+        # Running task pane, between the title and logs
+        self.dashboard = dashboard.Dashboard()
+        self.dashboard_rows = 0
+
         self.colors = {
             "border": "green",
             "info": "cyan",
@@ -111,7 +139,14 @@ class Terminal:
             if self.location < 0:
                 self.location = 0
 
-        self.log_count = self.term.height - 7
+        self.dashboard_rows = self.dashboard.rows
+        self.log_count = self.term.height - 7 - self.dashboard_rows
+
+        for listener in list(self.resize_listeners):
+            errorhandler.wrap_sync(
+                listener,
+                [self.term.width - 6, self.log_count]
+            )
 
         self.reprint(True)
 
@@ -120,7 +155,8 @@ class Terminal:
             all: bool = False,
             title: bool = False,
             logs: bool = False,
-            console: bool = False
+            console: bool = False,
+            dashboard: bool = False
         ) -> None:
         """
         Reprints the specified terminal sections.
@@ -130,6 +166,7 @@ class Terminal:
             title: bool - Redraw title box
             logs: bool - Redraw log section
             console: bool - Redraw console box
+            dashboard: bool - Redraw running task pane
         """
 
         if self.disable_log:
@@ -141,6 +178,7 @@ class Terminal:
         actions = {
             self.draw_box: False or all,
             self.print_title: title or all,
+            self.print_dashboard: dashboard or all,
             self.print_logs: logs or all,
             self.print_console: console or all
         }
@@ -156,10 +194,50 @@ class Terminal:
         if console or all:
             self.print_console()
 
+    def request_reprint(
+            self,
+            **sections
+        ) -> None:
+        """
+        Schedules a redraw on the event loop instead of
+        drawing immediately. Requests made before the redraw
+        happens are merged, so bursts of logs (ie: from many
+        commands at once) repaint at most once per render_interval.
+
+        Must be called from the event loop's thread.
+
+        Arguments:
+            **sections - Same as reprint()
+        """
+
+        for name, do in sections.items():
+            if do:
+                self.render_pending[name] = True
+
+        if self.render_handle is None:
+            self.render_handle = scriptlib.loop.call_later(self.render_interval, self.flush_reprint)
+
+    def flush_reprint(
+            self
+        ) -> None:
+        """
+        Runs a scheduled redraw.
+        """
+
+        sections = self.render_pending
+
+        self.render_pending = {}
+        self.render_handle = None
+
+        if len(sections) > 0:
+            self.reprint(**sections)
+
     def log(
             self,
             *message: List[str],
-            update: Optional[bool] = None
+            update: Optional[bool] = None,
+            category: Optional[str] = None,
+            log_type: Optional[str] = None
         ) -> None:
         """
         Logs a message to the terminal.
@@ -167,6 +245,8 @@ class Terminal:
         Arguments:
             message: str - Message to log
             update: bool - Automatically redraw
+            category: Optional[str] - Logger category, for searching
+            log_type: Optional[str] - Logger log type, for searching
         """
 
         comp_msg = []
@@ -184,7 +264,17 @@ class Terminal:
 
         message = ", ".join(comp_msg)
 
-        self.lines.append(message)
+        # Held across both, so lines logged from the console
+        # thread can't end up indexed under the wrong number
+        with self.lines.lock:
+            line = self.lines.append(message)
+
+            self.index.add(
+                line,
+                re.sub(ansi_escape, "", message),
+                category,
+                log_type
+            )
 
         # TODO: Log to file
 
@@ -193,6 +283,20 @@ class Terminal:
         if update:
             self.reprint(logs = True)
 
+    def replace_last(
+            self,
+            message: str
+        ) -> None:
+        """
+        Replaces the last logged line, ie: to redraw a progress
+        bar in place. The replacement isn't indexed for search.
+
+        Arguments:
+            message: str - New line
+        """
+
+        self.lines.replace_last(message)
+
     def getch(
             self,
             timeout: float = 0.02
@@ -263,16 +367,132 @@ class Terminal:
 
         self.reprint(logs = True)
 
+    def search(
+            self,
+            query: str
+        ) -> None:
+        """
+        Searches the logs and jumps to the first match
+        after the current location.
+
+        Arguments:
+            query: str - Search query. Words, plus optional
+                category:name and type:name filters.
+        """
+
+        if query.strip() == "":
+            self.index.clear()
+            self.search_line = None
+            self.search_status = None
+            self.reprint(logs = True, console = True)
+            return
+
+        self.index.search(query)
+        self.search_line = None
+
+        self.search_next(1, self.location - 1)
+
+    def search_next(
+            self,
+            direction: int,
+            start: Optional[int] = None
+        ) -> None:
+        """
+        Jumps to the next (or previous) match of the
+        active search.
+
+        Arguments:
+            direction: int - 1 for next, -1 for previous
+            start: Optional[int] - Line to search from.
+                Defaults to the current match.
+        """
+
+        if self.index.query is None:
+            return
+
+        if start is None:
+            start = self.search_line if self.search_line is not None else self.location - 1
+
+        line = self.index.next_match(start, direction)
+
+        if line is None:
+            self.search_line = None
+            self.search_status = "No matches"
+
+        else:
+            self.search_line = line
+            self.search_status = f"Match {self.index.position(line)}/{self.index.live_matches()}"
+            self.jump(line)
+
+        self.reprint(logs = True, console = True)
+
+    def jump(
+            self,
+            line: int
+        ) -> None:
+        """
+        Scrolls so that a line is visible, keeping it
+        in place as new lines are logged.
+
+        Arguments:
+            line: int - Line index to show
+        """
+
+        max_scroll = len(self.lines) - self.log_count
+
+        if max_scroll < 0:
+            max_scroll = 0
+
+        # Show a bit of context above the line
+        self.location = min(max(line - self.log_count // 3, 0), max_scroll)
+        self.manual_scroll = self.location < max_scroll
+
     def shutdown(
-            self
+            self,
+            dump: bool = False
         ) -> None:
         """
         Cleans up everything and stops printing.
+
+        Arguments:
+            dump: bool - Print the logs to stdout once out of
+                fullscreen, so they outlive the terminal (ie: in
+                a job runner's output)
         """
         self.console.shutdown = True
+
+        if self.render_handle is not None:
+            self.render_handle.cancel()
+            self.render_handle = None
+
         os.system("stty sane")
         print(self.term.exit_fullscreen + self.term.clear + self.term.home)
 
+        if dump:
+            self.dump_logs()
+
+        self.lines.close()
+
+    def dump_logs(
+            self,
+            chunk: int = 1000
+        ) -> None:
+        """
+        Prints every stored log line to stdout. Colors are
+        stripped unless stdout is a terminal.
+
+        Arguments:
+            chunk: int - Lines to read from the store at once
+        """
+
+        strip = not sys.stdout.isatty()
+
+        for start in range(0, len(self.lines), chunk):
+            for line in self.lines.window(start, chunk):
+                print(re.sub(ansi_escape, "", line) if strip else line)
+
+        sys.stdout.flush()
+
     # -- DRAW FUNCTIONS --
     def draw_box(
             self
@@ -283,6 +503,7 @@ class Terminal:
 
         # Our sections are at:
         # Lines 1, 3 and height - 3, height - 1
+        # (plus one under the dashboard, if it's showing)
         lines = {
             1: Border.TOP,
             3: Border.MIDDLE,
@@ -290,12 +511,16 @@ class Terminal:
             self.term.height - 1: Border.BOTTOM 
         }
 
+        if self.dashboard_rows > 0:
+            lines[3 + self.dashboard_rows] = Border.MIDDLE
+
         for line, border in lines.items():
             self.draw_border_line(line, border)
 
         # Draw the box - or, fill in everything else with Border.NONE.
         for line in [2, self.term.height - 2] + list(range(4, self.term.height - 3)):
-            self.draw_border_line(line, Border.NONE)
+            if line not in lines:
+                self.draw_border_line(line, Border.NONE)
 
     def draw_border_line(
             self,
@@ -330,6 +555,27 @@ class Terminal:
         with self.term.location(2, 2):
             print(self.center(f"{self.color['info']}{colors.TerminalColors.BOLD}{self.title}{colors.TerminalColors.RESET}"), end = "")
 
+    def print_dashboard(
+            self
+        ) -> None:
+        """
+        Prints the running task pane, if it's showing.
+        """
+
+        if self.dashboard_rows == 0:
+            return
+
+        width = self.term.width - 6
+
+        for i, (name, bar, details) in enumerate(self.dashboard.format(width, self.dashboard_rows - 1)):
+            line = f"{name}  {bar}  {details}" if bar else f"{name}  {details}"
+            line = line[:width]
+
+            spacer = " " * (width - len(line))
+
+            with self.term.location(2, 4 + i):
+                print(f"{self.color['info']}{colors.TerminalColors.BOLD}{name}{colors.TerminalColors.RESET}{line[len(name):]}{spacer}", end = "")
+
     def print_console(
             self
         ) -> None:
@@ -337,20 +583,50 @@ class Terminal:
         Draws out the bottom console line.
         """
 
+        # Only the part of the line around the cursor is drawn
+        visible = self.console.get_visible(self.term.width - 7)
+
         with self.term.location(2, self.term.height - 2):
             # 3 modes:
             # - Regular mode
             # - Ask mode
             # - Menu mode
             if self.console.mode == ConsoleModes.REGULAR:
-                form = f"{self.color['console']}{colors.TerminalColors.BOLD}${colors.TerminalColors.RESET} {self.color['console']}{self.console.current[ConsoleModes.REGULAR]}{colors.TerminalColors.RESET}"
+                form = f"{self.color['console']}{colors.TerminalColors.BOLD}${colors.TerminalColors.RESET} {self.color['console']}{visible}{colors.TerminalColors.RESET}"
+
+                # Show search status while the console is empty
+                if self.search_status and len(self.console.current[ConsoleModes.REGULAR]) == 0:
+                    form += f"{self.color['secondary']}{self.search_status}{colors.TerminalColors.RESET}"
 
             elif self.console.mode == ConsoleModes.ASK:
-                form = f"{self.color['ask']}{colors.TerminalColors.BOLD}>{colors.TerminalColors.RESET} {self.color['ask']}{self.console.current[ConsoleModes.ASK] if len(self.console.current[ConsoleModes.ASK]) > 0 else self.ask_mode['placeholder']}{colors.TerminalColors.RESET}"
+                form = f"{self.color['ask']}{colors.TerminalColors.BOLD}>{colors.TerminalColors.RESET} {self.color['ask']}{visible if len(self.console.current[ConsoleModes.ASK]) > 0 else self.ask_mode['placeholder']}{colors.TerminalColors.RESET}"
+
+            elif self.console.mode == ConsoleModes.HISTORY:
+                # Reverse search: query, then the match after it
+                if self.console.hist_match is not None:
+                    match = self.console.history.get(self.console.hist_match)
+
+                else:
+                    match = "(no match)"
+
+                match = match[:max(self.term.width - 11 - len(visible), 0)]
+
+                form = f"{self.color['console']}{colors.TerminalColors.BOLD}?{colors.TerminalColors.RESET} {self.color['console']}{visible}{colors.TerminalColors.RESET} {self.color['secondary']}→ {match}{colors.TerminalColors.RESET}"
 
             else:
-                raise NotImplementedError()
-                #form = f"{self.color['ask']}{colors.TerminalColors.BOLD}{self.console.current['menu']['id'] + 1}"
+                # Menu: typed/selected number, then the option it picks
+                options = self.menu_mode["options"]
+                selected = self.console.get_selection()
+
+                if selected is not None:
+                    option = f"→ {options[selected]}"
+
+                else:
+                    option = self.menu_mode["placeholder"]
+
+                option = option[:max(self.term.width - 11 - len(visible), 0)]
+
+                form = f"{self.color['ask']}{colors.TerminalColors.BOLD}@{colors.TerminalColors.RESET} {self.color['ask']}{visible}{colors.TerminalColors.RESET} {self.color['secondary']}{option}{colors.TerminalColors.RESET}"
 
             # Pad with spaces to clear old stuff
             form += " " * (self.term.width - 5 - len(re.sub(ansi_escape, "", form)))
@@ -359,26 +635,31 @@ class Terminal:
 
         # Move cursor to console location
         #self.log(str(self.console.location), True)
-        print(self.term.move_xy(self.console.location + 4, self.term.height - 2), end = "")
+        print(self.term.move_xy(self.console.location - self.console.view + 4, self.term.height - 2), end = "")
 
     def print_logs(
             self
         ) -> None:
         """
-        Prints out all stored logs.
+        Prints out the visible section of the stored logs.
         """
 
         # Generate scrollbar
         scrollbar = self.generate_scrollbar()
 
-        line_count = len(self.lines)
-        for i in range(0, self.term.height - 7):
-            location = i + 4
+        # Only read the lines that are actually on screen
+        window = self.lines.window(self.location, self.log_count)
+
+        # Logs start under the dashboard
+        top = 4 + self.dashboard_rows
+
+        for i in range(0, self.log_count):
+            location = i + top
             line_index = i + self.location
 
-            if line_index < line_count:
+            if i < len(window):
                 with self.term.location(2, location):
-                    line = self.lines[line_index].replace("\t", "    ")
+                    line = window[i].replace("\t", "    ")
 
                     line_numbers = False
                     if self.term.width < 80:
@@ -391,7 +672,7 @@ class Terminal:
 
                     if self.line_numbers and line_numbers:
                         if line.strip() != "":
-                            ext = f"{self.color['secondary']}{line_index + 1} "
+                            ext = f"{self.color['ask' if line_index == self.search_line else 'secondary']}{line_index + 1} "
                             line_numbers = True
 
                     stripped = re.sub(ansi_escape, "", line)
@@ -416,7 +697,7 @@ class Terminal:
         block = "█"
         empty = "░"
 
-        height = self.term.height - 7
+        height = self.log_count
 
         # Find out section of terminal we're viewing
         lines = len(self.lines)
@@ -509,7 +790,7 @@ class Terminal:
 
         self.console.mode = ConsoleModes.ASK
 
-        self.console.current[ConsoleModes.ASK] = ""
+        self.console.current[ConsoleModes.ASK].set("")
 
         self.reprint(console = True)
 
@@ -519,11 +800,65 @@ class Terminal:
         self.console.mode = ConsoleModes.REGULAR
         self.reprint(True)
 
-        self.log(f"{self.color['ask']}{colors.TerminalColors.BOLD}> {colors.TerminalColors.RESET}{self.color['ask']}{self.console.current[ConsoleModes.ASK]}")
+        answer = str(self.console.current[ConsoleModes.ASK])
+
+        self.log(f"{self.color['ask']}{colors.TerminalColors.BOLD}> {colors.TerminalColors.RESET}{self.color['ask']}{answer}")
+
+        self.reprint(logs = True)
+
+        return answer
+
+    async def menu(
+            self,
+            options: List[str],
+            placeholder: str
+        ) -> str:
+        """
+        Lets the user pick an option from the console line.
+        The arrow keys move between options, or a number can
+        be typed in.
+
+        Arguments:
+            options: List[str] - Option names
+            placeholder: str - Shown when no option is selected
+
+        Returns:
+            answer: str - Number entered, starting at 1. Not
+                validated, since it can be typed in.
+        """
+
+        self.menu_mode.update(
+            {
+                "active": True,
+                "complete": False,
+                "options": options,
+                "placeholder": placeholder
+            }
+        )
+
+        self.console.mode = ConsoleModes.MENU
+
+        # Start on the first option
+        self.console.current[ConsoleModes.MENU].set("1")
+        self.console.location = 1
+
+        self.reprint(console = True)
+
+        while not self.menu_mode["complete"]:
+            await asyncio.sleep(0.1)
+
+        self.menu_mode["active"] = False
+
+        self.console.mode = ConsoleModes.REGULAR
+        self.reprint(True)
+
+        answer = str(self.console.current[ConsoleModes.MENU])
+
+        self.log(f"{self.color['ask']}{colors.TerminalColors.BOLD}@ {colors.TerminalColors.RESET}{self.color['ask']}{answer}")
 
         self.reprint(logs = True)
 
-        return self.console.current[ConsoleModes.ASK]
+        return answer
 
 
 
@@ -538,4 +873,5 @@ class Border:
 class ConsoleModes:
     REGULAR = 0
     ASK = 1
-    MENU = 2
\ No newline at end of file
+    MENU = 2
+    HISTORY = 3
\ No newline at end of file
@@ -7,25 +7,45 @@ Base functions, decorators, and etc. that make running things easier.
 import scriptlib
 
 from scriptlib.utils import (
+    cmdcache,
     errorhandler,
-    exceptions
+    exceptions,
+    pools
 )
 
+import asyncio
+import functools
+import sys
 import traceback
+from typing import Optional
 
 def start(
         *args,
+        batch: Optional[bool] = None,
         **kwargs
-    ) -> None:
+    ) -> int:
     """
     A synchronous wrapper to scriptlib.run().
     
     Entrypoint to the script. Call this instead.
 
+    By default, the script keeps running (for the console)
+    until it's shut down. In batch mode, it exits as soon as
+    its subscripts finish, with their exit code (see
+    Script.get_exit_code()), and the logs are printed to
+    stdout on the way out.
+
     Parameters:
         config: dict - kwargs passed to scriptlib.script.init().
+        batch: Optional[bool] - Exit once everything's finished.
+            Defaults to whether --batch was passed.
+
+    Returns:
+        exit_code: int - Only returned when not in batch mode
     """
 
+    batch = "--batch" in sys.argv if batch is None else batch
+
     scriptlib.loop.set_exception_handler(errorhandler.catch_asyncio)
 
     try:
@@ -33,53 +53,80 @@ def start(
             start_terminal
         )
 
-        scriptlib.loop.run_until_complete(
-            errorhandler.wrap(
-                run(*args, **kwargs)
-            )
+        exit_code = scriptlib.loop.run_until_complete(
+            run(*args, **kwargs)
         )
 
-        scriptlib.loop.run_forever()
+        if not batch:
+            scriptlib.loop.run_forever()
+
+        cleanup(batch)
 
     except KeyboardInterrupt as e:
-        cleanup()
+        exit_code = 130
+        cleanup(batch)
 
     except (exceptions.CloseLoop):
-        cleanup()
+        # Set if the subscripts were cancelled
+        exit_code = getattr(scriptlib.script, "exit_code", None) or 0
+        cleanup(batch)
 
     except:
-        cleanup()
+        exit_code = 1
+        cleanup(batch)
         print("An unexpected pre-initialization error was encountered, so the script is exiting.")
         traceback.print_exc()
 
+    if batch:
+        sys.exit(exit_code)
+
+    return exit_code
+
 async def run(
         config: dict
-    ) -> None:
+    ) -> int:
     """
     Fires off the async event loop, initializes the script, and runs everything.
 
     Parameters:
         config: dict - kwargs passed to scriptlib.script.init().
+
+    Returns:
+        exit_code: int - 1 if anything failed, see Script.get_exit_code()
     """
     
+    success = True
+
     for task in [
             scriptlib.script.init(**config),
             scriptlib.script.run()
         ]:
 
-        await errorhandler.wrap(
-            task
-        )
+        if not await errorhandler.wrap(task):
+            success = False
 
-def cleanup() -> None:
-    # Shuts down everything cleanly.
-    # Event loop should not be running anymore.
+    if not success:
+        return 1
+
+    return scriptlib.script.exit_code
+
+def cleanup(
+        dump: bool = False
+    ) -> None:
+    """
+    Shuts down everything cleanly.
+    Event loop should not be running anymore.
+
+    Arguments:
+        dump: bool - Print the logs to stdout after leaving
+            fullscreen
+    """
 
     scriptlib.t.disable_log = True
 
     # Async tasks
     for task in [
-            
+            cancel_tasks
         ]:
 
         scriptlib.loop.run_until_complete(
@@ -90,13 +137,36 @@ def cleanup() -> None:
 
     # Sync tasks
     for task in [
-            scriptlib.terminal.shutdown
+            cmdcache.flush_all,
+            pools.shutdown,
+            functools.partial(scriptlib.terminal.shutdown, dump = dump)
         ]:
 
         errorhandler.wrap_sync(
-            task()
+            task
         )
 
+async def cancel_tasks() -> None:
+    """
+    Cancels whatever's still running on the loop (ie: the
+    stall watcher, or subscripts started from the console)
+    and gives it grace_period seconds to stop.
+    """
+
+    tasks = [
+        task
+        for task in asyncio.all_tasks()
+        if task is not asyncio.current_task()
+    ]
+
+    for task in tasks:
+        task.cancel()
+
+    if len(tasks) > 0:
+        config = getattr(scriptlib.script, "config", None)
+
+        await asyncio.wait(tasks, timeout = getattr(config, "grace_period", 5))
+
 async def shutdown() -> None:
     """
     Exits the script and returns to the terminal.
@@ -4,4 +4,5 @@ scriptlib.subscripts
 Holds all subscript classes that are ready to use.
 """
 
-from .task import TaskSubscript
\ No newline at end of file
+from .task import TaskSubscript
+from .menu import MenuSubscript
\ No newline at end of file
@@ -1,6 +1,6 @@
 """
-scriptlib.subscripts.task
-(scriptlib.subscripts.TaskScript)
+scriptlib.subscripts.menu
+(scriptlib.subscripts.MenuSubscript)
 
 """
 
@@ -20,16 +20,33 @@ class MenuSubscript(Subscript):
     """
     Menu for other scripts.
 
-    Make sure to add 'self.run = False' to any subscripts
-    added to the menu, or add the menu script first.
+    Subscripts added to the menu won't auto-run. Pick one
+    with the arrow keys (or type its number) and press enter.
+
+    With run_forever, the menu comes back after each
+    subscript finishes.
     """
 
     def __init__(
             self,
             subscripts: List[Subscript],
             dialog: str = "Menu",
-            run_forever: bool = False
+            run_forever: bool = False,
+            **kwargs
         ) -> None:
+        """
+        Initializes the object.
+
+        Arguments:
+            subscripts: List[Subscript] - Subscripts to pick from
+            dialog: str - Menu title
+            run_forever: bool - Show the menu again after each
+                subscript finishes
+            **kwargs - Passed to Subscript()
+        """
+
+        super().__init__(**kwargs)
+
         self.subscripts = subscripts
 
         # Disable auto-run on all subscripts
@@ -40,6 +57,9 @@ class MenuSubscript(Subscript):
 
         self.run_forever = run_forever
 
+        # Compiled selection rule, and the option count it's for
+        self.rule = None
+        self.rule_count = None
 
         global script
         from scriptlib import script
@@ -50,6 +70,33 @@ class MenuSubscript(Subscript):
         """
         Display the menu.
         """
+
+        while True:
+            num = await self.select()
+
+            sel_script = self.subscripts[num - 1]
+
+            # Run script
+            script.logger.log("ask", "menu", f"Running script {num}: {sel_script.name}")
+            script.logger.log_step("ask", "menu", sel_script.description)
+
+            await errorhandler.wrap(
+                sel_script.start()
+            )
+
+            if not self.run_forever:
+                return
+
+    async def select(
+            self
+        ) -> int:
+        """
+        Shows the menu and waits for a valid selection.
+
+        Returns:
+            num: int - 1-indexed subscript number
+        """
+
         # Print menu name
         script.logger.log("ask", "menu", f"-- {self.dialog} -- ", bold = True)
 
@@ -57,33 +104,27 @@ class MenuSubscript(Subscript):
         for i, subscript in enumerate(self.subscripts):
             script.logger.log_step("ask", "menu", f"{i + 1} | {subscript.name} | {subscript.description}")
 
-        num = None
-        while not num:
+        # Only recompiled if subscripts were added or removed
+        if self.rule_count != len(self.subscripts):
+            self.rule = await script.args.compile_recursive(
+                f"int[between(1,{len(self.subscripts)})]"
+            )
+            self.rule_count = len(self.subscripts)
+
+        while True:
             # Ask for result
-            scriptnum = await scriptlib.terminal.ask("Which script would you like to run?", "#", "Enter a script number here and press enter.")
+            scriptnum = await scriptlib.terminal.menu(
+                [subscript.name for subscript in self.subscripts],
+                "Pick a script with the arrow keys, or type its number, and press enter."
+            )
 
-            # Try to parse to an int
             valid, res = await script.args.parse(
-                f"int[between(1,{len(self.subscripts)}",
+                self.rule,
                 scriptnum,
                 {}
             )
 
-            if not valid:
-                script.logger.log("error", "menu", f"Invalid script number '{scriptnum}'. Try again.")
-
-            else:
-                num = res
-
-        sel_script = self.subscripts[num - 1]
-
-        # Run script
-        script.logger.log("ask", "menu", f"Running script {num}: {sel_script.name}")
-        script.logger.log_step("ask", "menu", sel_script.description)
-
-        await errorhandler.wrap(
-            sel_script.run()
-        )
+            if valid:
+                return res
 
-        if self.run_forever:
-            await self.run()
\ No newline at end of file
+            script.logger.log("error", "menu", f"Invalid script number '{scriptnum}'. Try again.")
@@ -4,54 +4,182 @@ scriptlib.subscripts.task
 
 """
 
-from typing import Iterable, Optional
+from typing import Iterable, List, Optional, Union
 import asyncio
+import cProfile
+import hashlib
+import heapq
+import inspect
+import json
+import os
+import resource
+import sys
+import time
 
 from scriptlib.utils import (
     exceptions,
-    errorhandler
+    errorhandler,
+    fileutils,
+    pools,
+    strutils,
+    subprocess
 )
 
 from scriptlib.classes.subscript import (
     Subscript
 )
 
+from scriptlib.classes import (
+    dashboard
+)
+
+import scriptlib
+
 class TaskSubscript(Subscript):
     """
     Task-based subscript.
     
-    Runs a number of functions sequentially. Define them with
+    Runs a number of functions. Define them with
     self.tasks, or self.add_tasks(*tasks) if not being
     extended.
+
+    Tasks run one at a time, in the order they were added,
+    unless parallel is raised. Then any task whose
+    dependencies have finished can run alongside others.
+
+    Every task is timed. A summary is logged at the end, and
+    a JSON report is written (see report_path). The slowest
+    tasks can be profiled with the task_profile_count option,
+    but only with parallel = 1 - otherwise a profile would
+    pick up whatever the other tasks did in the meantime.
+
+    Tasks that declare inputs are skipped if none of them
+    changed since the task last succeeded (and none of its
+    dependencies ran). Pass --force to run everything anyway,
+    or --dry-run to only list what would run.
+
+    Progress is checkpointed to a journal, so if a run fails
+    or is interrupted, the next one picks up where it left
+    off. Pass --restart to start over instead.
+
+    Every task's "if" condition is evaluated (concurrently)
+    before anything runs, so the run's plan is known up front.
+    Conditions that need to run commands should use
+    subscript.query(), which caches results for the run:
+        "if": lambda subscript: check_nginx(subscript)
+
+        async def check_nginx(subscript):
+            return (await subscript.query("systemctl is-active nginx")).returncode == 0
+
+    Running tasks are shown on the terminal's dashboard.
+    Tasks (async, or sync ones in the thread pool) can
+    report how far along they are:
+        dashboard.report(done / total, "Copying files")
     
     Sample task:
         {
             "name": "Sample task",
             "description": "Does something, maybe." # Optional. But don't be lazy and define this.
-            "function": self.sample_task, # Async function
-            "if": lambda subscript: subscript.some_value == 3 # Optional. Self is passed, use a lambda statement. Will only run if True.
+            "function": self.sample_task, # Async function, or a sync one (see executor)
+            "executor": "thread", # Optional. For sync functions: run in the shared thread (default) or process pool.
+            "if": lambda subscript: subscript.some_value == 3, # Optional. Self is passed, use a lambda statement. Will only run if True. Can be async.
+            "depends_on": ["Other task"], # Optional. Names of tasks that have to finish first.
+            "inputs": { # Optional. Skip the task if these haven't changed since it last succeeded.
+                "files": ["/etc/ssh/sshd_config"], # Hashed by content. Directories are walked.
+                "config": ["timezone"], # Config keys
+                "commands": ["dpkg -l openssh-server"] # Command outputs
+            },
+            "retries": 3, # Optional. Times to retry if it fails.
+            "backoff": 2.0 # Optional. Seconds before the first retry, doubling each time. Defaults to 1.
         }
     """
     def __init__(
             self,
             *tasks,
+            parallel: int = 1,
+            report_path: Optional[str] = None,
+            state_path: Optional[str] = None,
+            force: Optional[bool] = None,
+            dry_run: Optional[bool] = None,
+            journal_path: Optional[str] = None,
+            restart: Optional[bool] = None,
             **kwargs
         ) -> None:
         """
         Initializes the object.
+
+        Arguments:
+            *tasks: dict - Tasks to add
+            parallel: int - Max tasks running at once
+            report_path: Optional[str] - Where to write the JSON run
+                report. Defaults to ~/.local/share/scriptlib/
+                [script name]-[subscript name].report.json
+            state_path: Optional[str] - Where to keep input fingerprints.
+                Defaults to the same place, as .state.json
+            force: Optional[bool] - Run tasks even if they're up to
+                date. Defaults to whether --force was passed.
+            dry_run: Optional[bool] - Only log which tasks would run.
+                Defaults to whether --dry-run was passed.
+            journal_path: Optional[str] - Where to checkpoint progress.
+                Defaults to the same place, as .journal.json
+            restart: Optional[bool] - Ignore an unfinished run instead
+                of resuming it. Defaults to whether --restart was passed.
+            **kwargs - Passed to Subscript()
         """
 
         super().__init__(**kwargs)
 
+        if parallel < 1:
+            raise exceptions.DevError("Task parallelism must be at least 1")
+
+        self.parallel = parallel
+        self.report_path = report_path
+        self.state_path = state_path
+
+        self.force = "--force" in sys.argv if force is None else force
+        self.dry_run = "--dry-run" in sys.argv if dry_run is None else dry_run
+        self.restart = "--restart" in sys.argv if restart is None else restart
+
+        # Checkpoints of the current (or last unfinished) run
+        self.journal_path = journal_path
+        self.journal = None
+
+        # Task name -> result of its "if" condition, for this run
+        self.conditions = {}
+        # Command -> future of its result, shared by conditions
+        self.queries = {}
+
+        # Input fingerprints of the last successful runs
+        self.state = None
+        # Tasks actually executed (not skipped) this run
+        self.executed = set()
+
+        # Task name -> stats from the last run
+        self.results = {}
+
+        # Task name -> profile, while a run is going
+        self.profiles = {}
+
+        # Whether this run profiles its tasks
+        self.profiling = False
+
         # Define task structure.
         self.req = { # TODO: Use arg parser
             "name": lambda val: type(val) == str,
             "description": lambda val: type(val) == str,
-            "function": lambda val: asyncio.iscoroutinefunction(val)
+            "function": lambda val: callable(val)
         }
 
         self.opt = {
-            "if": lambda val: callable(val)
+            "if": lambda val: callable(val),
+            "depends_on": lambda val: type(val) in [list, tuple] and all(type(dep) == str for dep in val),
+            "inputs": lambda val: type(val) == dict and all(
+                name in ["files", "config", "commands"] and type(items) in [list, tuple]
+                for name, items in val.items()
+            ),
+            "executor": lambda val: val in ["thread", "process"],
+            "retries": lambda val: type(val) == int and val >= 0,
+            "backoff": lambda val: type(val) in [int, float] and val >= 0
         }
 
         self.tasks = {}
@@ -118,41 +246,921 @@ class TaskSubscript(Subscript):
                     "name": "Sample task",
                     "description": "Does something, maybe." # Optional. But don't be lazy and define this.
                     "function": self.sample_task, # Async function
-                    "if": lambda subscript: subscript.some_value == 3 # Optional. Self is passed, use a lambda statement. Will only run if True.
+                    "if": lambda subscript: subscript.some_value == 3, # Optional. Self is passed, use a lambda statement. Will only run if True.
+                    "depends_on": ["Other task"] # Optional. Must be added already, or in the same call.
                 }
         """
 
-        for task in tasks:
-            # Validate
-            valid, reason = self.validate_task(
-                task
-            )
+        added = []
+
+        try:
+            for task in tasks:
+                # Validate
+                valid, reason = self.validate_task(
+                    task
+                )
+
+                if not valid:
+                    raise exceptions.DevError(f"Invalid task {task.get('name') if type(task) == dict else 'None'}: {reason}")
 
-            if not valid:
-                raise exceptions.DevError(f"Invalid task {task.get('name') if type(task) == dict else 'None'}: {reason}")
+                self.tasks[task["name"]] = task
+                added.append(task["name"])
+
+            for name in added:
+                for dep in self.tasks[name].get("depends_on", []):
+                    if dep not in self.tasks:
+                        raise exceptions.DevError(f"Task {name} depends on unknown task {dep}")
+
+            # Throws if there's a cycle
+            self.get_order()
+
+        except exceptions.DevError:
+            # Don't leave half the tasks registered
+            for name in added:
+                del self.tasks[name]
+
+            raise
+
+    def get_order(
+            self
+        ) -> List[str]:
+        """
+        Sorts tasks so each comes after its dependencies.
+        Ties go to whichever was added first.
+
+        Returns:
+            order: List[str] - Task names
+        """
+
+        index = {name: i for i, name in enumerate(self.tasks)}
+        waiting, dependents = self.get_graph()
+
+        ready = [(index[name], name) for name, count in waiting.items() if count == 0]
+        heapq.heapify(ready)
+
+        order = []
+
+        while ready:
+            _, name = heapq.heappop(ready)
+            order.append(name)
+
+            for dependent in dependents[name]:
+                waiting[dependent] -= 1
+
+                if waiting[dependent] == 0:
+                    heapq.heappush(ready, (index[dependent], dependent))
+
+        if len(order) != len(self.tasks):
+            cycle = [name for name in self.tasks if name not in order]
+            raise exceptions.DevError(f"Task dependencies form a cycle: {', '.join(cycle)}")
+
+        return order
+
+    def get_graph(
+            self
+        ) -> tuple:
+        """
+        Builds the dependency graph.
+
+        Returns:
+            waiting: dict - Task name -> number of unfinished dependencies
+            dependents: dict - Task name -> tasks that depend on it
+        """
 
-            self.tasks[task["name"]] = task
+        waiting = {name: 0 for name in self.tasks}
+        dependents = {name: [] for name in self.tasks}
+
+        for name, task in self.tasks.items():
+            for dep in set(task.get("depends_on", [])):
+                waiting[name] += 1
+                dependents[dep].append(name)
+
+        return waiting, dependents
 
     async def run(
             self
         ) -> Optional[int]:
         """
         Runs all the tasks.
+
+        Tasks start as soon as their dependencies are done and
+        there's room under the parallelism limit. If one fails,
+        nothing new starts, but running tasks are allowed to finish.
         
         Returns:
             status_code: Optional[int] - Status code, if tasks returned any.
         """
 
-        for i, (name, task) in enumerate(self.tasks.items()):
-            # Log it
-            script.logger.log("info", "subscript", f"Running task {task['name']}: {task['description']} ({i + 1}/{len(self.tasks)})")
+        if self.dry_run:
+            await self.plan()
+            return
+
+        index = {name: i for i, name in enumerate(self.tasks)}
+        waiting, dependents = self.get_graph()
+
+        ready = [(index[name], name) for name, count in waiting.items() if count == 0]
+        heapq.heapify(ready)
+
+        self.load_state()
+
+        self.results = {}
+        self.profiles = {}
+        self.executed = set()
+
+        self.profiling = getattr(script.config, "task_profile_count", 0) > 0
+
+        if self.profiling and self.parallel > 1:
+            script.logger.log("warn", "subscript", f"Not profiling tasks of {self.name}: profiles are only accurate with parallel = 1.")
+            self.profiling = False
+
+        # Before the journal's touched, so a run that can't
+        # start doesn't leave anything to resume
+        if not await self.evaluate_conditions():
+            self.failed = True
+            return
+
+        self.load_journal()
+
+        skipped = [name for name, met in self.conditions.items() if not met]
+
+        script.logger.log("info", "subscript", f"Planned {len(self.tasks) - len(skipped)}/{len(self.tasks)} tasks for {self.name}.")
+
+        if skipped:
+            script.logger.log_step("info", "subscript", f"Conditions not met: {', '.join(skipped)}")
+        run_started = time.time()
+        run_wall = time.perf_counter()
+
+        running = {}
+        started = 0
+        failed = []
+
+        try:
+            while ready or running:
+                while ready and len(running) < self.parallel and not failed:
+                    _, name = heapq.heappop(ready)
+                    started += 1
+
+                    running[
+                        asyncio.ensure_future(self.run_task(self.tasks[name], started))
+                    ] = name
+
+                if len(running) == 0:
+                    break
+
+                done, _ = await asyncio.wait(running, return_when = asyncio.FIRST_COMPLETED)
+
+                for future in done:
+                    name = running.pop(future)
+
+                    if not future.result():
+                        failed.append(name)
+                        continue
+
+                    for dependent in dependents[name]:
+                        waiting[dependent] -= 1
+
+                        if waiting[dependent] == 0:
+                            heapq.heappush(ready, (index[dependent], dependent))
+
+        except asyncio.CancelledError:
+            # Don't leave running tasks behind
+            for future in running:
+                future.cancel()
+
+            await asyncio.gather(*running, return_exceptions = True)
+            raise
+
+        self.report(run_started, time.perf_counter() - run_wall)
+
+        self.failed = len(failed) > 0
+
+        if not failed:
+            # Nothing to resume
+            self.clear_journal()
+
+        if failed:
+            # Error occurred -- exit
+            script.logger.log("error", "subscript", f"An error occurred while executing task {', '.join(failed)}. Exiting subscript.")
+            return
+
+    async def run_task(
+            self,
+            task: dict,
+            number: int
+        ) -> bool:
+        """
+        Runs a single task.
+
+        Arguments:
+            task: dict - Task to run
+            number: int - How many tasks have been started, including this one
+
+        Returns:
+            success: bool
+        """
+
+        if task["name"] in self.journal["completed"]:
+            skipped = "already finished in the last run"
+
+        elif not self.conditions.get(task["name"], True):
+            skipped = "condition not met"
+
+        elif await self.is_up_to_date(task):
+            skipped = "up to date"
+
+        else:
+            skipped = None
+
+        if skipped is not None:
+            script.logger.log("info", "subscript", f"Skipping task {task['name']}: {skipped}. ({number}/{len(self.tasks)})")
+
+            self.results[task["name"]] = {
+                "name": task["name"],
+                "status": "skipped",
+                "started": time.time(),
+                "wall": 0.0,
+                "cpu": 0.0,
+                "child_cpu": 0.0,
+                "peak_rss_delta_kb": 0,
+                "subprocesses": 0,
+                "profile": None
+            }
+
+            # Not journaled - a skipped task is checked again
+            # on resume, in case its condition or inputs changed
+            return True
+
+        self.executed.add(task["name"])
+
+        # Log it
+        script.logger.log("info", "subscript", f"Running task {task['name']}: {task['description']} ({number}/{len(self.tasks)})")
 
+        profiler = cProfile.Profile() if self.profiling else None
+
+        # Counts commands spawned in this task's context only
+        counter = [0]
+        subprocess.spawn_counter.set(counter)
+
+        progress = scriptlib.terminal.dashboard.start(task["name"])
+        dashboard.current.set(progress)
+
+        started = time.time()
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        children = get_child_cpu()
+        cpu = time.process_time()
+        wall = time.perf_counter()
+
+        if profiler is not None:
+            profiler.enable()
+
+        try:
             # Do it
-            res = await errorhandler.wrap(
-                task['function']()
+            success = await self.attempt(task)
+
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+            progress.finish()
+
+        self.results[task["name"]] = {
+            "name": task["name"],
+            "status": "success" if success else "failed",
+            "started": started,
+            "wall": time.perf_counter() - wall,
+            # Process-wide, so overlapping tasks share it
+            "cpu": time.process_time() - cpu,
+            "child_cpu": get_child_cpu() - children,
+            "peak_rss_delta_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss,
+            "subprocesses": counter[0],
+            "profile": None
+        }
+
+        if profiler is not None:
+            self.profiles[task["name"]] = profiler
+
+        if success and "inputs" in task:
+            # Fingerprinted after the run, so a task that changes its
+            # own inputs is up to date next time
+            self.state["tasks"][task["name"]] = await self.fingerprint(task)
+            self.save_state()
+
+        if success:
+            self.checkpoint(task["name"])
+
+        else:
+            self.journal["failed"].append(task["name"])
+            self.save_journal()
+
+        return success
+
+    async def attempt(
+            self,
+            task: dict
+        ) -> bool:
+        """
+        Runs a task's function, retrying with exponential
+        backoff if it's retryable. Attempts are journaled, so
+        a resumed run doesn't get a fresh set of retries.
+
+        Arguments:
+            task: dict
+
+        Returns:
+            success: bool
+        """
+
+        name = task["name"]
+        retries = task.get("retries", 0)
+        backoff = task.get("backoff", 1.0)
+
+        while True:
+            self.journal["attempts"][name] = self.journal["attempts"].get(name, 0) + 1
+            self.save_journal()
+
+            attempt = self.journal["attempts"][name]
+
+            if await errorhandler.wrap(self.call(task)):
+                return True
+
+            if attempt > retries:
+                return False
+
+            delay = backoff * 2 ** (attempt - 1)
+
+            script.logger.log("warn", "subscript", f"Task {name} failed (attempt {attempt}/{retries + 1}). Retrying in {round(delay, 2)}s.")
+
+            await asyncio.sleep(delay)
+
+    async def call(
+            self,
+            task: dict
+        ):
+        """
+        Calls a task's function. Sync functions are run in a
+        shared pool, so they don't block the event loop.
+
+        Anything else that returns an awaitable (ie: a lambda
+        calling an async method) gets it awaited on the loop.
+
+        Arguments:
+            task: dict
+        """
+
+        function = task["function"]
+
+        if asyncio.iscoroutinefunction(function):
+            return await function()
+
+        result = await pools.run(
+            task.get("executor", "thread"),
+            function
+        )
+
+        if inspect.isawaitable(result):
+            result = await result
+
+        return result
+
+    def read_journal(
+            self
+        ) -> Optional[dict]:
+        """
+        Reads the journal of an unfinished run, without changing it.
+
+        Returns:
+            journal: Optional[dict] - None if there isn't one,
+                or the run was started with restart
+        """
+
+        if self.journal_path is None:
+            self.journal_path = self.get_path("journal.json")
+
+        if self.restart:
+            return None
+
+        try:
+            with open(self.journal_path, "r") as f:
+                previous = json.load(f)
+
+        except (OSError, ValueError):
+            return None
+
+        # Only tasks that still exist count
+        previous["completed"] = [
+            name
+            for name in previous.get("completed", [])
+            if name in self.tasks
+        ]
+
+        return previous
+
+    def load_journal(
+            self
+        ) -> None:
+        """
+        Reads the journal of an unfinished run, if there is one,
+        so it can be resumed.
+        """
+
+        previous = self.read_journal()
+
+        self.journal = {
+            "started": time.time(),
+            # Tasks that ran successfully
+            "completed": [],
+            "attempts": {},
+            "failed": []
+        }
+
+        if previous is None:
+            self.save_journal()
+            return
+
+        completed = previous["completed"]
+
+        if len(completed) > 0:
+            script.logger.log("info", "subscript", f"Resuming the last run of {self.name}: {len(completed)}/{len(self.tasks)} tasks already finished.")
+
+        self.journal["started"] = previous.get("started", self.journal["started"])
+        self.journal["completed"] = completed
+
+        # Whatever ran last time still counts as having changed
+        # things, for its dependents' up-to-date checks
+        self.executed.update(completed)
+
+        # A failed task gets a new set of retries, but one that was
+        # interrupted mid-retry doesn't
+        failed = previous.get("failed", [])
+
+        self.journal["attempts"] = {
+            name: count
+            for name, count in previous.get("attempts", {}).items()
+            if name in self.tasks and name not in failed
+        }
+
+        self.save_journal()
+
+    def checkpoint(
+            self,
+            name: str
+        ) -> None:
+        """
+        Journals a task that ran successfully.
+
+        Arguments:
+            name: str - Task name
+        """
+
+        if name not in self.journal["completed"]:
+            self.journal["completed"].append(name)
+
+        self.save_journal()
+
+    def save_journal(
+            self
+        ) -> None:
+        """
+        Writes the journal.
+        """
+
+        try:
+            fileutils.write_json(self.journal_path, self.journal)
+
+        except OSError as e:
+            script.logger.log("warn", "subscript", f"Couldn't write task journal to {self.journal_path}: {e}")
+
+    def clear_journal(
+            self
+        ) -> None:
+        """
+        Deletes the journal once a run finishes.
+        """
+
+        try:
+            os.remove(self.journal_path)
+
+        except OSError:
+            pass
+
+    async def plan(
+            self
+        ) -> List[str]:
+        """
+        Logs which tasks would run, without running anything.
+
+        Returns:
+            tasks: List[str] - Names of tasks that would run
+        """
+
+        self.load_state()
+
+        # Read-only - a dry run doesn't touch the journal
+        previous = self.read_journal()
+        completed = previous["completed"] if previous is not None else []
+
+        # Same as a resumed run()
+        self.executed = set(completed)
+
+        if not await self.evaluate_conditions():
+            self.failed = True
+            return []
+
+        script.logger.log("info", "subscript", f"Dry run of {self.name}:", bold = True)
+
+        would_run = []
+
+        for name in self.get_order():
+            task = self.tasks[name]
+
+            if name in completed:
+                script.logger.log_step("info", "subscript", f"{name}: completed (resumed)")
+
+            elif not self.conditions[name]:
+                script.logger.log_step("info", "subscript", f"{name}: condition not met")
+
+            elif await self.is_up_to_date(task):
+                script.logger.log_step("info", "subscript", f"{name}: up to date")
+
+            else:
+                # Treated as run, so its dependents are too
+                self.executed.add(name)
+                would_run.append(name)
+                script.logger.log_step("success", "subscript", f"{name}: would run")
+
+        return would_run
+
+    async def evaluate_conditions(
+            self
+        ) -> bool:
+        """
+        Evaluates every task's "if" condition at once.
+        Results go in self.conditions.
+
+        Returns:
+            success: bool - False if a condition raised an error
+        """
+
+        self.queries = {}
+
+        names = list(self.tasks)
+
+        results = await asyncio.gather(
+            *[self.evaluate_condition(self.tasks[name]) for name in names],
+            return_exceptions = True
+        )
+
+        self.conditions = {}
+        success = True
+
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                script.logger.log("error", "subscript", f"Couldn't evaluate the condition of task {name}. Exiting subscript.")
+                errorhandler.handle_errors(result)
+                success = False
+
+            self.conditions[name] = result is True
+
+        return success
+
+    async def evaluate_condition(
+            self,
+            task: dict
+        ) -> bool:
+        """
+        Evaluates a task's "if" condition.
+
+        Arguments:
+            task: dict
+
+        Returns:
+            met: bool - True if it has no condition
+        """
+
+        if "if" not in task:
+            return True
+
+        result = task["if"](self)
+
+        if inspect.isawaitable(result):
+            result = await result
+
+        return bool(result)
+
+    async def query(
+            self,
+            command: Union[str, List[str]]
+        ) -> subprocess.Command:
+        """
+        Runs a command for a condition. Results are shared for
+        the rest of the run, so conditions checking the same
+        thing only run it once - even if they check at the
+        same time.
+
+        Arguments:
+            command: str|List[str] - Command or argv
+
+        Returns:
+            command: Command - Finished command. A non-zero exit
+                code isn't an error - check returncode.
+        """
+
+        key = command if type(command) == str else tuple(command)
+
+        if key not in self.queries:
+            self.queries[key] = asyncio.ensure_future(run_query(command))
+
+        return await self.queries[key]
+
+    async def is_up_to_date(
+            self,
+            task: dict
+        ) -> bool:
+        """
+        Checks if a task can be skipped: it has inputs, none
+        changed since it last succeeded, and none of its
+        dependencies ran this time.
+
+        Arguments:
+            task: dict
+        """
+
+        if self.force or "inputs" not in task:
+            return False
+
+        if any(dep in self.executed for dep in task.get("depends_on", [])):
+            return False
+
+        previous = self.state["tasks"].get(task["name"])
+
+        return previous is not None and previous == await self.fingerprint(task)
+
+    async def fingerprint(
+            self,
+            task: dict
+        ) -> str:
+        """
+        Hashes everything a task declared as input.
+
+        Arguments:
+            task: dict
+
+        Returns:
+            fingerprint: str - SHA-256 hex digest
+        """
+
+        inputs = task["inputs"]
+        digest = hashlib.sha256()
+
+        for path in inputs.get("files", []):
+            for file_path, file_hash in await self.hash_path(os.path.expanduser(path)):
+                digest.update(f"file\0{file_path}\0{file_hash}\0".encode())
+
+        for key in inputs.get("config", []):
+            value = json.dumps(getattr(script.config, key, None), sort_keys = True, default = repr)
+            digest.update(f"config\0{key}\0{value}\0".encode())
+
+        for command in inputs.get("commands", []):
+            try:
+                output = await subprocess.check_output(command)
+
+            except exceptions.SubprocessError as e:
+                output = f"failed: {e}"
+
+            digest.update(f"command\0{command}\0{output}\0".encode())
+
+        return digest.hexdigest()
+
+    async def hash_path(
+            self,
+            path: str
+        ) -> List[tuple]:
+        """
+        Hashes a file, or every file in a directory.
+
+        Files whose size and mtime haven't changed since they
+        were last hashed aren't read again.
+
+        Arguments:
+            path: str
+
+        Returns:
+            hashes: List[tuple] - (path, hash) for each file
+        """
+
+        if os.path.isdir(path):
+            paths = sorted(
+                os.path.join(root, name)
+                for root, _, names in os.walk(path)
+                for name in names
+            )
+
+        else:
+            paths = [path]
+
+        hashes = []
+        cache = self.state["files"]
+
+        for file_path in paths:
+            try:
+                stat = os.stat(file_path)
+
+            except OSError:
+                hashes.append((file_path, "missing"))
+                continue
+
+            cached = cache.get(file_path)
+
+            if cached is not None and cached["mtime"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+                hashes.append((file_path, cached["hash"]))
+                continue
+
+            try:
+                # Big files shouldn't hold up the loop
+                file_hash = await pools.run("thread", hash_file, file_path)
+
+            except OSError:
+                hashes.append((file_path, "unreadable"))
+                continue
+
+            cache[file_path] = {
+                "mtime": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "hash": file_hash
+            }
+
+            hashes.append((file_path, file_hash))
+
+        return hashes
+
+    def get_path(
+            self,
+            suffix: str
+        ) -> str:
+        """
+        Gets the default path for one of this subscript's files.
+
+        Arguments:
+            suffix: str - ie: report.json
+        """
+
+        return os.path.join(os.path.expanduser("~"), ".local", "share", "scriptlib", f"{strutils.get_slug(script.name)}-{strutils.get_slug(self.name)}.{suffix}")
+
+    def load_state(
+            self
+        ) -> None:
+        """
+        Reads stored input fingerprints.
+        """
+
+        if self.state_path is None:
+            self.state_path = self.get_path("state.json")
+
+        self.state = {
+            "tasks": {},
+            "files": {}
+        }
+
+        try:
+            with open(self.state_path, "r") as f:
+                self.state.update(json.load(f))
+
+        except (OSError, ValueError):
+            # Nothing's up to date without a state file
+            pass
+
+    def save_state(
+            self
+        ) -> None:
+        """
+        Stores input fingerprints.
+        """
+
+        try:
+            fileutils.write_json(self.state_path, self.state)
+
+        except OSError as e:
+            script.logger.log("warn", "subscript", f"Couldn't save task state to {self.state_path}: {e}")
+
+    def report(
+            self,
+            started: float,
+            wall: float
+        ) -> None:
+        """
+        Logs a summary of the last run (slowest first), writes
+        its JSON report, and saves profiles of the slowest tasks.
+
+        Arguments:
+            started: float - Epoch time the run started
+            wall: float - Seconds the run took
+        """
+
+        results = sorted(self.results.values(), key = lambda result: result["wall"], reverse = True)
+
+        path = self.report_path
+
+        if path is None:
+            path = self.get_path("report.json")
+
+        base = path[:-len(".json")] if path.endswith(".json") else path
+
+        # Keep profiles for the slowest tasks only
+        profile_count = getattr(script.config, "task_profile_count", 0)
+
+        for result in results:
+            profiler = self.profiles.pop(result["name"], None)
+
+            if profiler is None or profile_count == 0:
+                continue
+
+            profile_count -= 1
+            result["profile"] = f"{base}.{strutils.get_slug(result['name'])}.prof"
+
+            try:
+                os.makedirs(os.path.dirname(result["profile"]) or ".", exist_ok = True)
+                profiler.dump_stats(result["profile"])
+
+            except OSError:
+                result["profile"] = None
+
+        self.profiles = {}
+
+        # Summary table
+        script.logger.log("info", "subscript", f"Ran {len(results)}/{len(self.tasks)} tasks in {round(wall, 2)}s:", bold = True)
+        script.logger.log_step("info", "subscript", f"{strutils.pad_to('Task', 32)} {strutils.pad_to('Status', 8)} {strutils.pad_to('Wall', 9)} {strutils.pad_to('CPU', 9)} {strutils.pad_to('Child CPU', 10)} {strutils.pad_to('RSS +KB', 9)} Cmds")
+
+        for result in results:
+            script.logger.log_step(
+                "error" if result["status"] == "failed" else "info",
+                "subscript",
+                f"{strutils.pad_to(result['name'], 32)} {strutils.pad_to(result['status'], 8)} {strutils.pad_to(format(result['wall'], '.3f') + 's', 9)} {strutils.pad_to(format(result['cpu'], '.3f') + 's', 9)} {strutils.pad_to(format(result['child_cpu'], '.3f') + 's', 10)} {strutils.pad_to(str(result['peak_rss_delta_kb']), 9)} {result['subprocesses']}"
             )
 
-            if not res:
-                # Error occurred -- exit
-                script.logger.log("error", "subscript", f"An error occurred while executing task {task['name']}. Exiting subscript.")
-                return
\ No newline at end of file
+        report = {
+            "subscript": self.name,
+            "started": started,
+            "wall": wall,
+            "parallel": self.parallel,
+            "tasks": results
+        }
+
+        try:
+            fileutils.write_json(path, report, indent = 4)
+
+        except OSError as e:
+            script.logger.log("warn", "subscript", f"Couldn't write task report to {path}: {e}")
+            return
+
+        script.logger.log_step("info", "subscript", f"Report written to {path}")
+
+async def run_query(
+        command: Union[str, List[str]]
+    ) -> subprocess.Command:
+    """
+    Runs a command quietly, without raising on a non-zero
+    exit code.
+
+    Arguments:
+        command: str|List[str] - Command or argv
+    """
+
+    cmd = subprocess.Command(command, log = False)
+
+    try:
+        await cmd._init()
+
+    except exceptions.SubprocessError:
+        pass
+
+    return cmd
+
+def hash_file(
+        path: str
+    ) -> str:
+    """
+    Hashes a file's contents.
+
+    Arguments:
+        path: str
+
+    Returns:
+        hash: str - SHA-256 hex digest
+    """
+
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1048576), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+def get_child_cpu() -> float:
+    """
+    Gets the CPU time used by all reaped child processes.
+    """
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return usage.ru_utime + usage.ru_stime
@@ -4,5 +4,6 @@ from . import (
     colors,
     strutils,
     timeutils,
-    userutils
+    userutils,
+    fileutils
 )
\ No newline at end of file
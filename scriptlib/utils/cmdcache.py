@@ -0,0 +1,538 @@
+"""
+scriptlib.utils.cmdcache
+
+Opt-in result cache for commands whose output rarely
+changes (package lists, the current user, etc).
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Union
+
+from . import (
+    exceptions,
+    fileutils,
+    pools,
+    subprocess
+)
+
+# Every cache, so unsaved results can be written on exit
+caches = weakref.WeakSet()
+
+# Command() arguments that change what a command's result
+# looks like, and their defaults
+output_options = {
+    "stderr": "merge",
+    "capture": "all",
+    "max_lines": None,
+    "max_bytes": None,
+    "max_line": 65536,
+    "encoding": "utf-8",
+    "pty": False,
+    "shell": None
+}
+
+# Environment variables that change most commands' output.
+# LC_* variables are included too.
+env_keys = ["PATH", "HOME", "LANG", "LANGUAGE"]
+
+class CommandCache:
+    """
+    LRU cache of successful command results.
+
+    Results are keyed on the command, working directory
+    and part of the environment: PATH, HOME, LANG, LANGUAGE,
+    LC_*, and any variables passed as env. Other variables
+    (ie: ones that change every run, like SSH_AUTH_SOCK or
+    OLDPWD) don't affect the key - add the ones a cached
+    command depends on. They can expire after a TTL, and/or
+    when any of a list of files changes.
+
+    Sample:
+        packages = await cmdcache.cache.run(
+            "dpkg -l",
+            ttl = 3600,
+            watch = ["/var/lib/dpkg/status"],
+            log = False
+        )
+    """
+
+    def __init__(
+            self,
+            size: int = 256,
+            ttl: Optional[float] = None,
+            path: Optional[str] = None,
+            save_delay: float = 1.0,
+            env: List[str] = []
+        ) -> None:
+        """
+        Creates a cache.
+
+        Arguments:
+            size: int - Max results kept in memory
+            ttl: Optional[float] - Default seconds a result is
+                valid for. None means until invalidated.
+            path: Optional[str] - File to persist results to
+                between runs. Loaded on first use.
+            save_delay: float - Seconds to batch up changes for
+                before persisting them
+            env: List[str] - Extra environment variables results
+                depend on (see env_keys)
+        """
+
+        if size < 1:
+            raise exceptions.DevError("Cache size must be at least 1")
+
+        self.size = size
+        self.ttl = ttl
+        self.path = path
+
+        self.save_delay = save_delay
+
+        self.env = env_keys + list(env)
+
+        self.loaded = False
+        self.entries = OrderedDict()
+
+        # Pending persist
+        self.dirty = False
+        self.save_handle = None
+        self.saving = None
+
+        # Snapshots are numbered, so an older one can't
+        # overwrite a newer one that was written first
+        self.generation = 0
+        self.written = 0
+        self.write_lock = threading.Lock()
+
+        caches.add(self)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def stats(self) -> dict:
+        """
+        Gets cache stats.
+
+        Returns:
+            stats: dict - entries, hits, misses, evictions,
+                invalidations, hit_rate
+        """
+
+        lookups = self.hits + self.misses
+
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0
+        }
+
+    def get_key(
+            self,
+            command: Union[str, List[str]],
+            **kwargs
+        ) -> str:
+        """
+        Gets the cache key for a command in the current
+        directory and environment (see the class docstring).
+
+        Arguments:
+            command: str|List[str] - Command or argv
+            **kwargs - Command() arguments. Only the ones that
+                change the result (see output_options) count.
+
+        Returns:
+            key: str
+        """
+
+        data = json.dumps(
+            [
+                command if type(command) == str else list(command),
+                [kwargs.get(name, default) for name, default in output_options.items()],
+                os.getcwd(),
+                sorted(
+                    (name, value) for name, value in os.environ.items()
+                    if name in self.env or name.startswith("LC_")
+                )
+            ]
+        )
+
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    async def run(
+            self,
+            command: Union[str, List[str]],
+            ttl: Optional[float] = None,
+            watch: List[str] = [],
+            **kwargs
+        ) -> Union["CachedCommand", subprocess.Command]:
+        """
+        Gets a command's cached result, or runs it and
+        caches the result. Failed commands aren't cached.
+
+        Arguments:
+            command: str|List[str] - Command or argv
+            ttl: Optional[float] - Overrides the cache's TTL
+            watch: List[str] - Files that invalidate the result
+                when they change
+            **kwargs - Passed to subprocess.run() on a miss
+
+        Returns:
+            command: CachedCommand|Command - Cached result, or
+                the command that was just run
+        """
+
+        if kwargs.get("stream"):
+            raise exceptions.DevError("Streamed commands can't be cached")
+
+        self.load()
+
+        key = self.get_key(command, **kwargs)
+        entry = self.lookup(key)
+
+        if entry is not None:
+            self.hits += 1
+            return CachedCommand(entry)
+
+        self.misses += 1
+
+        # Checked before running, so a change during the run isn't missed
+        mtimes = {path: get_mtime(path) for path in watch}
+
+        cmd = await subprocess.run(command, **kwargs)
+
+        ttl = self.ttl if ttl is None else ttl
+
+        self.store(
+            key,
+            {
+                "command": cmd.command,
+                "result": cmd.result,
+                "errors": cmd.errors.text() if cmd.errors is not None else None,
+                "created": time.time(),
+                "expires": time.time() + ttl if ttl is not None else None,
+                "watch": mtimes
+            }
+        )
+
+        return cmd
+
+    def lookup(
+            self,
+            key: str
+        ) -> Optional[dict]:
+        """
+        Gets a valid entry, dropping it if it's stale.
+
+        Arguments:
+            key: str
+
+        Returns:
+            entry: Optional[dict]
+        """
+
+        entry = self.entries.get(key)
+
+        if entry is None:
+            return None
+
+        stale = entry["expires"] is not None and time.time() >= entry["expires"]
+
+        if not stale:
+            for path, mtime in entry["watch"].items():
+                if get_mtime(path) != mtime:
+                    stale = True
+                    break
+
+        if stale:
+            del self.entries[key]
+            self.invalidations += 1
+            self.save()
+            return None
+
+        self.entries.move_to_end(key)
+
+        return entry
+
+    def store(
+            self,
+            key: str,
+            entry: dict
+        ) -> None:
+        """
+        Adds an entry, evicting the least recently used
+        ones if the cache is full.
+
+        Arguments:
+            key: str
+            entry: dict
+        """
+
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.size:
+            self.entries.popitem(last = False)
+            self.evictions += 1
+
+        self.save()
+
+    def invalidate(
+            self,
+            command: Optional[Union[str, List[str]]] = None,
+            **kwargs
+        ) -> None:
+        """
+        Drops a command's cached result, or everything.
+
+        Arguments:
+            command: Optional[str|List[str]] - Command to drop.
+                Clears the whole cache if None.
+            **kwargs - Command() arguments it was run with
+        """
+
+        self.load()
+
+        if command is None:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+
+        else:
+            key = self.get_key(command, **kwargs)
+
+            if key not in self.entries:
+                return
+
+            del self.entries[key]
+            self.invalidations += 1
+
+        self.save()
+
+    def load(
+            self
+        ) -> None:
+        """
+        Reads persisted results, if that hasn't been done yet.
+        """
+
+        if self.loaded:
+            return
+
+        self.loaded = True
+
+        if self.path is None or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+
+        except (OSError, ValueError):
+            # A bad cache file just means a cold cache
+            return
+
+        for key, entry in data:
+            self.entries[key] = entry
+
+        while len(self.entries) > self.size:
+            self.entries.popitem(last = False)
+
+    def save(
+            self
+        ) -> None:
+        """
+        Schedules the results to be persisted, if there's a
+        file to persist them to.
+
+        Changes are batched for save_delay seconds, then written
+        in the thread pool, so a big cache doesn't hold up the
+        event loop. Outside of the loop, they're written right away.
+        """
+
+        if self.path is None:
+            return
+
+        self.dirty = True
+
+        try:
+            loop = asyncio.get_running_loop()
+
+        except RuntimeError:
+            self.flush()
+            return
+
+        if self.save_handle is None:
+            self.save_handle = loop.call_later(self.save_delay, self.start_save)
+
+    def start_save(
+            self
+        ) -> None:
+        """
+        Starts writing pending changes in the thread pool.
+        """
+
+        self.save_handle = None
+
+        if not self.dirty:
+            return
+
+        if self.saving is not None and not self.saving.done():
+            # One write at a time, so they land in order
+            self.save_handle = asyncio.get_running_loop().call_later(self.save_delay, self.start_save)
+            return
+
+        self.dirty = False
+        self.generation += 1
+
+        # Entries are replaced, never changed, so a shallow copy is a snapshot
+        self.saving = asyncio.ensure_future(
+            pools.run("thread", self.write, list(self.entries.items()), self.generation)
+        )
+
+    def flush(
+            self
+        ) -> None:
+        """
+        Writes pending changes now. Called for every cache
+        on exit (see flush_all()).
+        """
+
+        if self.save_handle is not None:
+            self.save_handle.cancel()
+            self.save_handle = None
+
+        if not self.dirty or self.path is None:
+            return
+
+        self.dirty = False
+        self.generation += 1
+
+        self.write(list(self.entries.items()), self.generation)
+
+    def write(
+            self,
+            data: list,
+            generation: int
+        ) -> None:
+        """
+        Writes the cache file. Safe to call from any thread.
+
+        Arguments:
+            data: list - [key, entry] pairs
+            generation: int - Snapshot number
+        """
+
+        with self.write_lock:
+            if generation <= self.written:
+                return
+
+            try:
+                fileutils.write_json(self.path, data)
+
+            except OSError:
+                return
+
+            self.written = generation
+
+class CachedCommand:
+    """
+    A command result served from the cache. Has the same
+    result accessors as a finished Command.
+    """
+
+    cached = True
+
+    def __init__(
+            self,
+            entry: dict
+        ) -> None:
+        """
+        Arguments:
+            entry: dict - Cache entry
+        """
+
+        self.command = entry["command"]
+        self.result = entry["result"]
+        self.errors = entry["errors"]
+        self.created = entry["created"]
+
+        # Only successful results are cached
+        self.returncode = 0
+        self.timed_out = False
+
+    @property
+    def error_result(self) -> str:
+        """
+        Gets the command's stderr.
+        Only available with stderr = "separate".
+        """
+
+        if self.errors is None:
+            raise exceptions.DevError("stderr is merged into stdout - use stderr = \"separate\"")
+
+        return self.errors
+
+    @property
+    def data(self) -> list:
+        """
+        Gets a list of all captured lines.
+        """
+
+        return list(self.lines())
+
+    def lines(
+            self
+        ) -> Iterator[str]:
+        """
+        Iterates over captured lines.
+        """
+
+        if self.result == "":
+            return iter([])
+
+        return iter(self.result.split("\n"))
+
+    def close(
+            self
+        ) -> None:
+        pass
+
+def get_mtime(
+        path: str
+    ) -> Optional[int]:
+    """
+    Gets a file's modification time, or None if
+    it doesn't exist.
+
+    Arguments:
+        path: str
+    """
+
+    try:
+        return os.stat(path).st_mtime_ns
+
+    except OSError:
+        return None
+
+def flush_all() -> None:
+    """
+    Writes every cache's pending changes.
+    """
+
+    for cache in list(caches):
+        cache.flush()
+
+# Shared cache for scripts that don't need their own
+cache = CommandCache()
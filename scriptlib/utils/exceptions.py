@@ -26,6 +26,12 @@ class SubprocessError(Exception):
     Raised on failed subprocess call.
     """
 
+class SubprocessTimeout(SubprocessError):
+    """
+    Raised when a subprocess is killed for running
+    past its timeout.
+    """
+
 class InvalidData(Exception):
     """
     Exception used by the argument parser when
@@ -0,0 +1,50 @@
+"""
+scriptlib.utils.fileutils
+
+Utility functions for safely writing files.
+"""
+
+import json
+import os
+from typing import Optional
+
+def write_atomic(
+        path: str,
+        text: str
+    ) -> None:
+    """
+    Writes a file through a temp file, which is synced
+    and then moved into place. A crash mid-write leaves
+    the old file intact rather than a truncated one.
+
+    Arguments:
+        path: str
+        text: str - New contents
+    """
+
+    temp = f"{path}.tmp"
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+
+    with open(temp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temp, path)
+
+def write_json(
+        path: str,
+        data,
+        indent: Optional[int] = None
+    ) -> None:
+    """
+    Atomically writes data as JSON (see write_atomic()).
+
+    Arguments:
+        path: str
+        data: Any - JSON-serializable data
+        indent: Optional[int]
+    """
+
+    write_atomic(path, json.dumps(data, indent = indent))
@@ -0,0 +1,103 @@
+"""
+scriptlib.utils.pools
+
+Shared thread and process pools, for running blocking or
+CPU-heavy functions without holding up the event loop.
+"""
+
+import concurrent.futures
+import contextvars
+import functools
+from typing import Callable
+
+from . import (
+    exceptions
+)
+
+import scriptlib
+
+executors = {
+    "thread": None,
+    "process": None
+}
+
+def get_executor(
+        kind: str
+    ) -> concurrent.futures.Executor:
+    """
+    Gets a shared pool, creating it on first use.
+    Sized by the thread_pool_size/process_pool_size
+    config options (0 uses Python's default).
+
+    Arguments:
+        kind: str - thread or process
+
+    Returns:
+        executor: Executor
+    """
+
+    if kind not in executors:
+        raise exceptions.DevError(f"Invalid executor {kind} - use thread or process")
+
+    if executors[kind] is None:
+        config = getattr(scriptlib.script, "config", None)
+        size = getattr(config, f"{kind}_pool_size", 0) or None
+
+        if kind == "thread":
+            executors[kind] = concurrent.futures.ThreadPoolExecutor(
+                max_workers = size,
+                thread_name_prefix = "scriptlib"
+            )
+
+        else:
+            executors[kind] = concurrent.futures.ProcessPoolExecutor(
+                max_workers = size
+            )
+
+    return executors[kind]
+
+async def run(
+        kind: str,
+        function: Callable,
+        *args,
+        **kwargs
+    ):
+    """
+    Runs a sync function in a shared pool.
+
+    Functions run in the process pool (and their arguments
+    and results) have to be picklable - ie: module-level
+    functions, not methods of a subscript. Functions run in
+    the thread pool see the caller's context variables.
+
+    Arguments:
+        kind: str - thread or process
+        function: Callable - Sync function
+        *args, **kwargs - Passed to function
+
+    Returns:
+        result: Any - Whatever function returned
+    """
+
+    call = functools.partial(function, *args, **kwargs)
+
+    if kind == "thread":
+        call = functools.partial(contextvars.copy_context().run, call)
+
+    return await scriptlib.loop.run_in_executor(
+        get_executor(kind),
+        call
+    )
+
+def shutdown() -> None:
+    """
+    Shuts down the pools. Queued work is cancelled, and
+    running work is waited for.
+    """
+
+    for kind, executor in executors.items():
+        if executor is None:
+            continue
+
+        executors[kind] = None
+        executor.shutdown(wait = True, cancel_futures = True)
@@ -0,0 +1,446 @@
+"""
+scriptlib.utils.shell
+
+Long-lived shell sessions for running lots of small
+commands without spawning a new process for each one.
+"""
+
+import asyncio
+import codecs
+import os
+import shlex
+import signal
+import time
+import uuid
+from typing import Optional
+
+from . import (
+    exceptions,
+    subprocess
+)
+
+class ShellSession:
+    """
+    A /bin/sh process that's started once and then fed
+    commands through its stdin.
+
+    Each command runs in a subshell, so a failing (or
+    exiting) command can't take the session down with it,
+    and things like cd don't leak into the next command.
+    Output and exit codes are delimited by sentinel lines.
+
+    Sample:
+        session = shell.ShellSession()
+
+        command = await session.run("systemctl is-active nginx")
+        print(command.returncode, command.result)
+
+        await session.close()
+    """
+
+    def __init__(
+            self,
+            shell: str = "/bin/sh",
+            chunk_size: int = 65536
+        ) -> None:
+        """
+        Creates a session. The shell is started on first use.
+
+        Arguments:
+            shell: str - Shell to run commands in
+            chunk_size: int - Bytes to read from the pipe at once
+        """
+
+        self.shell = shell
+        self.chunk_size = chunk_size
+
+        self.process = None
+        self.lock = asyncio.Lock()
+
+        # Unique per session, so command output can't fake it
+        self.sentinel = f"__scriptlib_{uuid.uuid4().hex}__".encode()
+        self.marker = b"\n" + self.sentinel + b" "
+
+        # Output read past the end of the last command
+        self.buffer = b""
+
+        self.commands_run = 0
+
+    @property
+    def alive(self) -> bool:
+        """
+        Whether the shell is running.
+        """
+
+        return self.process is not None and self.process.returncode is None
+
+    async def start(
+            self
+        ) -> None:
+        """
+        Starts the shell, if it isn't running already.
+        """
+
+        if self.alive:
+            return
+
+        started = time.perf_counter()
+
+        self.process = await asyncio.create_subprocess_exec(
+            self.shell,
+            stdin = asyncio.subprocess.PIPE,
+            stdout = asyncio.subprocess.PIPE,
+            stderr = asyncio.subprocess.STDOUT,
+            start_new_session = True
+        )
+
+        subprocess.record_spawn("shell", time.perf_counter() - started)
+
+        self.buffer = b""
+
+    async def run(
+            self,
+            command: str,
+            check: bool = True,
+            **kwargs
+        ) -> "SessionCommand":
+        """
+        Runs a command in the session and waits for it
+        to finish.
+
+        Arguments:
+            command: str - Command to run
+            check: bool - Raise SubprocessError on a non-zero
+                exit code, like subprocess.run()
+            **kwargs - Passed to SessionCommand()
+
+        Returns:
+            command: SessionCommand - Finished command
+        """
+
+        cmd = SessionCommand(command, self, **kwargs)
+
+        await cmd._init(check)
+
+        return cmd
+
+    async def execute(
+            self,
+            command: "SessionCommand"
+        ) -> int:
+        """
+        Sends a command to the shell and feeds its output
+        into it. Use run() instead.
+
+        Arguments:
+            command: SessionCommand - Command to run
+
+        Returns:
+            returncode: int - Exit code of the command
+        """
+
+        async with self.lock:
+            # Timed from here, so waiting for earlier commands
+            # doesn't count against this one's timeout
+            return await asyncio.wait_for(
+                self.send(command),
+                command.timeout
+            )
+
+    async def send(
+            self,
+            command: "SessionCommand"
+        ) -> int:
+        """
+        Sends a command to the shell and reads its output.
+        The session's lock must be held.
+
+        Arguments:
+            command: SessionCommand - Command to run
+
+        Returns:
+            returncode: int - Exit code of the command
+        """
+
+        await self.start()
+
+        started = time.perf_counter()
+
+        # eval'd from a quoted string, so even a syntax error
+        # can't leave the shell waiting for more input
+        script = (
+            f"( eval {shlex.quote(command.command)} ) </dev/null 2>&1\n"
+            f"printf '\\n%s %d\\n' {self.sentinel.decode()} $?\n"
+        )
+
+        try:
+            self.process.stdin.write(script.encode())
+            await self.process.stdin.drain()
+
+        except (BrokenPipeError, ConnectionResetError):
+            await self.close()
+            raise exceptions.SubprocessError("Shell session closed")
+
+        except asyncio.CancelledError:
+            # Part of the command may already be in the shell
+            await self.close()
+            raise
+
+        command.spawn_time = time.perf_counter() - started
+        subprocess.record_spawn("session", command.spawn_time)
+
+        self.commands_run += 1
+
+        try:
+            return await self.read_until_marker(command)
+
+        except asyncio.CancelledError:
+            # The command is still running and the output is out
+            # of sync - start over with a fresh shell
+            await self.close()
+            raise
+
+    async def read_until_marker(
+            self,
+            command: "SessionCommand"
+        ) -> int:
+        """
+        Reads output until the command's sentinel line.
+
+        Arguments:
+            command: SessionCommand - Command to feed output into
+
+        Returns:
+            returncode: int - Exit code from the sentinel line
+        """
+
+        decoder = codecs.getincrementaldecoder(command.encoding)(errors = "replace")
+        buffer = self.buffer
+
+        while True:
+            index = buffer.find(self.marker)
+
+            if index != -1:
+                end = buffer.find(b"\n", index + len(self.marker))
+
+                if end != -1:
+                    break
+
+            else:
+                # Pass along everything that can't be the start of a marker
+                safe = max(0, len(buffer) - len(self.marker))
+
+                if safe > 0:
+                    command.bytes_read += safe
+                    command.feed(decoder.decode(buffer[:safe]))
+                    buffer = buffer[safe:]
+
+            chunk = await self.process.stdout.read(self.chunk_size)
+
+            if not chunk:
+                # The shell itself died
+                self.buffer = b""
+                await self.close()
+                raise exceptions.SubprocessError("Shell session closed")
+
+            buffer += chunk
+
+        command.bytes_read += index
+        command.feed(decoder.decode(buffer[:index], final = True))
+
+        returncode = int(buffer[index + len(self.marker):end])
+        self.buffer = buffer[end + 1:]
+
+        return returncode
+
+    async def close(
+            self
+        ) -> None:
+        """
+        Stops the shell.
+        """
+
+        if self.process is None:
+            return
+
+        process = self.process
+        self.process = None
+
+        if process.returncode is None:
+            process.stdin.close()
+
+            # Takes down whatever command is running, too
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+
+            except ProcessLookupError:
+                pass
+
+            await process.wait()
+
+class SessionCommand(subprocess.Command):
+    """
+    A command run in a ShellSession. Output is captured,
+    decoded and logged just like a regular Command.
+    """
+
+    def __init__(
+            self,
+            command: str,
+            session: ShellSession,
+            **kwargs
+        ) -> None:
+        """
+        Creates a session command. Use ShellSession.run() instead.
+
+        Arguments:
+            command: str - Command to run
+            session: ShellSession - Session to run it in
+            **kwargs - Passed to Command()
+        """
+
+        if kwargs.get("stream") or kwargs.get("stderr", "merge") != "merge":
+            raise exceptions.DevError("Session commands don't support streaming or separate stderr")
+
+        super().__init__(command, **kwargs)
+
+        self.session = session
+        self.exit_code = None
+
+    @property
+    def returncode(self) -> Optional[int]:
+        """
+        Gets the command's exit code, or None if it
+        hasn't finished.
+        """
+
+        return self.exit_code
+
+    async def _init(
+            self,
+            check: bool = True
+        ) -> None:
+        """
+        Runs the command in its session.
+
+        Arguments:
+            check: bool - Raise SubprocessError on a non-zero
+                exit code
+        """
+
+        self.started = time.perf_counter()
+
+        try:
+            self.exit_code = await self.session.execute(self)
+
+        except asyncio.TimeoutError:
+            # The session was restarted to stop it
+            self.timed_out = True
+            self.kill_signal = signal.SIGKILL
+            self.finished = time.perf_counter()
+
+            subprocess.reap_stats["timed_out"] += 1
+
+            raise exceptions.SubprocessTimeout(f"'{self.command}' timed out after {self.timeout}s")
+
+        # Last unterminated line
+        self.flush_partial()
+        self.finish_logs()
+
+        self.finished = time.perf_counter()
+
+        if check and self.exit_code != 0:
+            raise exceptions.SubprocessError(self.exit_code)
+
+    async def start(
+            self
+        ) -> None:
+        raise exceptions.DevError("Session commands can't be started separately. Use ShellSession.run()")
+
+    async def wait(
+            self
+        ) -> None:
+        raise exceptions.DevError("Session commands can't be started separately. Use ShellSession.run()")
+
+    async def kill(
+            self
+        ) -> None:
+        """
+        Kills the command - along with the session it runs in.
+        """
+
+        await self.session.close()
+
+class ShellPool:
+    """
+    A few shell sessions, so commands can run
+    concurrently. Each session runs one command at a time.
+
+    Sample:
+        pool = shell.ShellPool(size = 4)
+
+        results = await asyncio.gather(*[
+            pool.run(f"stat -c %s {path}", log = False)
+            for path in paths
+        ])
+
+        await pool.close()
+    """
+
+    def __init__(
+            self,
+            size: int = 4,
+            **kwargs
+        ) -> None:
+        """
+        Creates a pool. Sessions are started as they're needed.
+
+        Arguments:
+            size: int - Number of sessions
+            **kwargs - Passed to each ShellSession()
+        """
+
+        if size < 1:
+            raise exceptions.DevError("Pool size must be at least 1")
+
+        self.sessions = [ShellSession(**kwargs) for _ in range(size)]
+
+        self.idle = asyncio.Queue()
+
+        for session in self.sessions:
+            self.idle.put_nowait(session)
+
+    async def run(
+            self,
+            command: str,
+            **kwargs
+        ) -> SessionCommand:
+        """
+        Runs a command in the first free session.
+        A session that died is restarted.
+
+        Arguments:
+            command: str - Command to run
+            **kwargs - Passed to ShellSession.run()
+
+        Returns:
+            command: SessionCommand - Finished command
+        """
+
+        session = await self.idle.get()
+
+        try:
+            return await session.run(command, **kwargs)
+
+        finally:
+            self.idle.put_nowait(session)
+
+    async def close(
+            self
+        ) -> None:
+        """
+        Stops every session.
+        """
+
+        for session in self.sessions:
+            await session.close()
@@ -5,6 +5,8 @@ Miscellaneous utility functions for manipulating
 strings.
 """
 
+import re
+
 def expand_placeholders(
         message: str,
         placeholders: dict
@@ -44,4 +46,16 @@ def pad_to(
     if trunc:
         value = value[:length]
 
-    return value + (" " * (length - len(value)))
\ No newline at end of file
+    return value + (" " * (length - len(value)))
+
+def get_slug(
+        name: str
+    ) -> str:
+    """
+    Makes a name safe to use in a filename.
+
+    Arguments:
+        name: str
+    """
+
+    return re.sub(r"\W+", "-", name.lower()).strip("-")
\ No newline at end of file
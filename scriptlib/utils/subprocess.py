@@ -6,8 +6,23 @@ shell commands.
 """
 
 import asyncio
+import codecs
+import contextvars
+import errno
+import fcntl
+import mmap
+import os
+import re
 import shlex
+import signal
+import struct
 import subprocess
+import tempfile
+import termios
+import time
+import warnings
+from collections import deque
+from typing import Iterator, List, Optional, Union
 
 from . import (
     exceptions
@@ -15,14 +30,261 @@ from . import (
 
 import scriptlib
 
-def sync_run(command):
-    subprocess.call(command, shell = True)
+def sync_run(
+        command: str
+    ) -> int:
+    """
+    Runs a shell command synchronously.
+
+    This blocks until the command finishes, so from async
+    code, await call() instead. Calls made while the event
+    loop is running in this thread log a warning.
+
+    Arguments:
+        command: str - Command to run
+
+    Returns:
+        returncode: int
+    """
+
+    warn_blocking("sync_run", "call")
+
+    return subprocess.call(command, shell = True)
+
+def get_output(
+        command: str
+    ) -> bytes:
+    """
+    Runs a command synchronously and gets its output.
+
+    This blocks until the command finishes, so from async
+    code, await check_output() instead. Calls made while the
+    event loop is running in this thread log a warning.
+
+    Arguments:
+        command: str - Command to run
+
+    Returns:
+        output: bytes - Raw stdout
+    """
+
+    warn_blocking("get_output", "check_output")
 
-def get_output(command):
     return subprocess.check_output(shlex.split(command))
 
-async def run(command):
-    cmd = Command(command)
+def warn_blocking(
+        name: str,
+        alternative: str
+    ) -> None:
+    """
+    Warns if a blocking function is called from the event
+    loop's thread, where it holds up everything else.
+
+    Arguments:
+        name: str - Blocking function
+        alternative: str - Async function to use instead
+    """
+
+    try:
+        asyncio.get_running_loop()
+
+    except RuntimeError:
+        return
+
+    message = f"subprocess.{name}() blocks the event loop. Use 'await subprocess.{alternative}()' instead."
+
+    logger = getattr(getattr(scriptlib, "script", None), "logger", None)
+
+    if logger is not None:
+        logger.log("warn", "subprocess", message)
+
+    else:
+        warnings.warn(message, RuntimeWarning, stacklevel = 3)
+
+async def call(
+        command: Union[str, List[str]],
+        **kwargs
+    ) -> int:
+    """
+    Runs a command and gets its exit code. Awaitable
+    version of sync_run() - a non-zero exit code isn't
+    an error.
+
+    Arguments:
+        command: str|List[str] - Command to run, or its argv
+        **kwargs - Passed to Command()
+
+    Returns:
+        returncode: int
+    """
+
+    cmd = Command(command, **kwargs)
+
+    try:
+        await cmd._init()
+
+    except exceptions.SubprocessError:
+        pass
+
+    return cmd.returncode
+
+async def check_output(
+        command: Union[str, List[str]],
+        **kwargs
+    ) -> str:
+    """
+    Runs a command and gets its output. Awaitable version
+    of get_output() - raises SubprocessError on a non-zero
+    exit code. Output isn't logged unless log = True is passed.
+
+    Arguments:
+        command: str|List[str] - Command to run, or its argv
+        **kwargs - Passed to Command()
+
+    Returns:
+        output: str - Decoded output
+    """
+
+    kwargs.setdefault("log", False)
+
+    cmd = await run(command, **kwargs)
+
+    return cmd.result
+
+# Anything that needs a real shell to interpret
+SHELL_CHARS = re.compile(r"[|&;<>()$`\\*?\[\]{}~#!\n]")
+# VAR=value command
+ENV_ASSIGN = re.compile(r"^\s*[A-Za-z_][A-Za-z0-9_]*=")
+# Builtins with no executable to run
+SHELL_BUILTINS = {
+    ".", ":", "alias", "bg", "break", "cd", "command", "continue",
+    "eval", "exec", "exit", "export", "fg", "jobs", "read", "readonly",
+    "return", "set", "shift", "source", "trap", "type", "ulimit",
+    "umask", "unalias", "unset", "wait"
+}
+
+# Spawn latency, by spawning method
+spawn_stats = {
+    "exec": {"count": 0, "total": 0.0, "max": 0.0},
+    "shell": {"count": 0, "total": 0.0, "max": 0.0},
+    "session": {"count": 0, "total": 0.0, "max": 0.0}
+}
+
+# Per-task spawn count, if something (ie: a TaskSubscript) is counting
+spawn_counter = contextvars.ContextVar("spawn_counter", default = None)
+
+# How commands ended
+reap_stats = {
+    "exited": 0,
+    "terminated": 0,
+    "killed": 0,
+    "timed_out": 0,
+    "cancelled": 0,
+    # Seconds between the first signal and the process being reaped
+    "reap_time": 0.0
+}
+
+def split_command(
+        command: Union[str, List[str]]
+    ) -> Optional[List[str]]:
+    """
+    Gets the argv for a command, if it can be run
+    without a shell.
+
+    Arguments:
+        command: str|List[str] - Command string or argv
+
+    Returns:
+        argv: Optional[List[str]] - None if it needs a shell
+    """
+
+    if type(command) in [list, tuple]:
+        return [str(arg) for arg in command]
+
+    if SHELL_CHARS.search(command) or ENV_ASSIGN.match(command):
+        return None
+
+    try:
+        argv = shlex.split(command)
+
+    except ValueError:
+        return None
+
+    if len(argv) == 0 or argv[0] in SHELL_BUILTINS:
+        return None
+
+    return argv
+
+def record_spawn(
+        method: str,
+        duration: float
+    ) -> None:
+    """
+    Adds a spawn to the latency stats.
+
+    Arguments:
+        method: str - exec, shell or session
+        duration: float - Seconds it took to spawn
+    """
+
+    stats = spawn_stats[method]
+    stats["count"] += 1
+    stats["total"] += duration
+    stats["max"] = max(stats["max"], duration)
+
+    counter = spawn_counter.get()
+
+    if counter is not None:
+        counter[0] += 1
+
+def get_reap_stats() -> dict:
+    """
+    Gets stats on how every command run so far ended.
+
+    Returns:
+        stats: dict - exited (on their own), terminated (by
+            SIGTERM), killed (escalated to SIGKILL), timed_out,
+            cancelled, and total reap_time in seconds
+    """
+
+    return dict(reap_stats)
+
+def get_spawn_stats() -> dict:
+    """
+    Gets spawn latency stats for every command run so far.
+
+    Returns:
+        stats: dict - Per method: count, total, average & max
+            spawn time, in seconds
+    """
+
+    return {
+        method: {
+            **stats,
+            "average": stats["total"] / stats["count"] if stats["count"] > 0 else 0.0
+        }
+        for method, stats in spawn_stats.items()
+    }
+
+async def run(
+        command: Union[str, List[str]],
+        **kwargs
+    ):
+    """
+    Runs a command and waits for it to finish.
+
+    Simple commands (and argv lists) are run directly,
+    without starting a shell for them.
+
+    Arguments:
+        command: str|List[str] - Command to run, or its argv
+        **kwargs - Passed to Command()
+
+    Returns:
+        command: Command - Finished command
+    """
+
+    cmd = Command(command, **kwargs)
 
     await cmd._init()
 
@@ -30,85 +292,1471 @@ async def run(command):
 
 class Command:
     def __init__(
-            self, 
-            command
+            self,
+            command,
+            encoding: str = "utf-8",
+            chunk_size: int = 65536,
+            max_line: int = 65536,
+            log: bool = True,
+            capture: str = "all",
+            max_lines: Optional[int] = None,
+            max_bytes: Optional[int] = None,
+            label: Optional[str] = None,
+            shell: Optional[bool] = None,
+            stderr: str = "merge",
+            stream: bool = False,
+            buffer: int = 16,
+            tee: bool = False,
+            timeout: Optional[float] = None,
+            grace: float = 5.0,
+            pty: bool = False
         ) -> None:
-        self.command = command
-        
+        """
+        Creates a command. Use run() instead.
+
+        Arguments:
+            command: str|List[str] - Command to run, or its argv
+            encoding: str - Codec to decode output with. Invalid
+                data is replaced instead of dropped.
+            chunk_size: int - Bytes to read from the pipe at once
+            max_line: int - Lines longer than this many characters
+                are split up as they stream in, instead of being
+                held in memory until they end
+            log: bool - Log output to the terminal
+            capture: str - How output is kept:
+                all: Keep every line in memory
+                ring: Keep only the last max_lines lines/max_bytes bytes
+                file: Spill everything to a temp file
+                none: Don't keep output
+            max_lines: Optional[int] - Line limit for ring capture
+            max_bytes: Optional[int] - Byte limit for ring capture
+            label: Optional[str] - Prefix for logged output, to tell
+                concurrent commands apart
+            shell: Optional[bool] - Run through /bin/sh. By default,
+                only commands that need it are.
+            stderr: str - What to do with stderr:
+                merge: Treat it as part of stdout
+                separate: Capture (and stream) it on its own
+            stream: bool - Make output available through
+                stdout_lines()/stderr_lines(). Reading stops while
+                the consumer is behind, so it must be consumed.
+            buffer: int - Chunks (of up to chunk_size bytes) held
+                for a streaming consumer before reading pauses
+            tee: bool - Log output through the logger (under the
+                subprocess category) instead of as raw lines
+            timeout: Optional[float] - Seconds the command may run
+                for before it's killed (SubprocessTimeout is raised)
+            grace: float - Seconds between SIGTERM and SIGKILL
+                when killing the command
+            pty: bool - Run the command in a pseudo-terminal, so it
+                doesn't buffer its output or hide progress bars.
+                Lines redrawn with carriage returns are updated in
+                place in the log. Implies stderr = "merge".
+        """
+        if stderr not in ["merge", "separate"]:
+            raise exceptions.DevError(f"Invalid stderr mode {stderr}")
+
+        if pty and stderr != "merge":
+            raise exceptions.DevError("A pty has a single output stream - stderr can't be separated")
+
+        if type(command) in [list, tuple]:
+            if shell:
+                raise exceptions.DevError("Can't run an argv list through the shell")
+
+            self.argv = split_command(command)
+            self.command = shlex.join(self.argv)
+
+        else:
+            self.argv = None if shell else split_command(command)
+            self.command = command
+
+        # Fall back to the shell if the executable isn't found, so
+        # the error looks the same as it would have
+        self.fallback = type(command) == str and self.argv is not None
+
         self.process = None
         self.task = None
 
-        self.data = []
+        self.streams = {
+            "stdout": OutputStream(
+                "stdout",
+                get_capture(capture, max_lines, max_bytes),
+                buffer if stream else None
+            )
+        }
+
+        if stderr == "separate":
+            self.streams["stderr"] = OutputStream(
+                "stderr",
+                get_capture(capture, max_lines, max_bytes),
+                buffer if stream else None
+            )
+
+        self.output = self.streams["stdout"].output
+        self.errors = self.streams["stderr"].output if stderr == "separate" else None
+        self._result = None
+
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.max_line = max_line
+        self.log = log
+        self.tee = tee
+        self.label = label
+
+        self.timeout = timeout
+        self.grace = grace
+        self.deadline = None
+
+        self.pty = pty
+        # Master side of the pty, while it's open
+        self.master = None
+
+        self.timed_out = False
+        # Strongest signal sent to the process group, if any
+        self.kill_signal = None
+        self.reap_time = None
+
+        # Throughput stats
+        self.bytes_read = 0
+        self.lines_read = 0
+        self.started = None
+        self.finished = None
+        self.spawn_time = None
 
     @property
     def result(self) -> str:
         """
         Gets a joined version of the task's current
-        stdout.
-        
+        stdout, one line per line. Only joined once after
+        the command has finished.
+
+        Returns:
+            result (str)
+        """
+        if self._result is not None:
+            return self._result
+
+        result = self.output.text()
+
+        if self.finished is not None:
+            self._result = result
+
+        return result
+
+    @property
+    def error_result(self) -> str:
+        """
+        Gets a joined version of the command's stderr.
+        Only available with stderr = "separate".
+
         Returns:
             result (str)
         """
-        return "".join(self.data)
+
+        if self.errors is None:
+            raise exceptions.DevError("stderr is merged into stdout - use stderr = \"separate\"")
+
+        return self.errors.text()
+
+    @property
+    def data(self) -> list:
+        """
+        Gets a list of all captured lines.
+        Use lines() to avoid copying them.
+
+        Returns:
+            data (list)
+        """
+        return list(self.output.lines())
+
+    def lines(
+            self
+        ) -> Iterator[str]:
+        """
+        Lazily iterates over captured lines.
+        """
+
+        return self.output.lines()
+
+    def stdout_lines(
+            self
+        ):
+        """
+        Asynchronously iterates over stdout lines as they're
+        read. Requires stream = True. Reading from the process
+        pauses while this falls behind.
+
+        Sample:
+            command = subprocess.Command("journalctl -f", stream = True, log = False)
+            await command.start()
+
+            async for line in command.stdout_lines():
+                ...
+        """
+
+        return self.streams["stdout"].iterate()
+
+    def stderr_lines(
+            self
+        ):
+        """
+        Asynchronously iterates over stderr lines as they're
+        read. Requires stream = True and stderr = "separate".
+        """
+
+        if "stderr" not in self.streams:
+            raise exceptions.DevError("stderr is merged into stdout - use stderr = \"separate\"")
+
+        return self.streams["stderr"].iterate()
+
+    def view(
+            self
+        ):
+        """
+        Gets a read-only memory-mapped view of captured output.
+        Only available with capture = "file".
+
+        Returns:
+            view: mmap.mmap - UTF-8 encoded output
+        """
+
+        if type(self.output) != FileCapture:
+            raise exceptions.DevError("Memory-mapped output views are only available with file capture")
+
+        return self.output.view()
+
+    def close(
+            self
+        ) -> None:
+        """
+        Releases captured output (and its temp file, if any).
+        """
+
+        for stream in self.streams.values():
+            stream.output.close()
+
+    @property
+    def stats(self) -> dict:
+        """
+        Gets output throughput stats.
+
+        Returns:
+            stats: dict - bytes, lines, seconds, bytes_per_second,
+                lines_per_second, spawn_time
+        """
+
+        if self.started is None:
+            seconds = 0
+
+        else:
+            seconds = (self.finished or time.perf_counter()) - self.started
+
+        return {
+            "bytes": self.bytes_read,
+            "lines": self.lines_read,
+            "seconds": seconds,
+            "bytes_per_second": self.bytes_read / seconds if seconds > 0 else 0,
+            "lines_per_second": self.lines_read / seconds if seconds > 0 else 0,
+            "spawn_time": self.spawn_time
+        }
+
+    @property
+    def returncode(self) -> Optional[int]:
+        """
+        Gets the command's exit code, or None if it
+        hasn't finished.
+        """
+
+        if self.process is None:
+            return None
+
+        return self.process.returncode
 
     async def _init(
             self
         ) -> None:
         """
         Asynchronously initializes and runs a command.
+        Cancelling the task running this kills the command.
         """
-        self.process = await asyncio.create_subprocess_shell(
-            self.command,
-            stdin = asyncio.subprocess.PIPE,
-            stdout = asyncio.subprocess.PIPE,
-            stderr = asyncio.subprocess.STDOUT
-        )
 
-        scriptlib.loop.create_task(self.handle_stdout())
+        await self.start()
+        await self.wait()
+
+    async def start(
+            self
+        ) -> None:
+        """
+        Starts the command, without waiting for it to finish.
+
+        It gets its own process group, so everything it
+        spawns can be killed along with it.
+        """
+        self.started = time.perf_counter()
+
+        if self.timeout is not None:
+            self.deadline = self.started + self.timeout
+
+        pipes = {
+            "stdin": asyncio.subprocess.PIPE,
+            "stdout": asyncio.subprocess.PIPE,
+            "stderr": asyncio.subprocess.PIPE if "stderr" in self.streams else asyncio.subprocess.STDOUT,
+            "start_new_session": True
+        }
+
+        slave = None
+
+        if self.pty:
+            self.master, slave = os.openpty()
+            os.set_blocking(self.master, False)
+
+            pipes.update(
+                stdin = slave,
+                stdout = slave,
+                stderr = slave
+            )
+
+            terminal = scriptlib.terminal
+
+            if hasattr(terminal, "log_count"):
+                self.resize(terminal.term.width - 6, terminal.log_count)
+                terminal.resize_listeners.append(self.resize)
+
+            else:
+                self.resize(80, 24)
+
+        method = "shell"
+
+        try:
+            if self.argv is not None:
+                try:
+                    self.process = await asyncio.create_subprocess_exec(*self.argv, **pipes)
+                    method = "exec"
+
+                except OSError:
+                    if not self.fallback:
+                        raise
 
-        await self.process.wait()
+            if method == "shell":
+                self.process = await asyncio.create_subprocess_shell(self.command, **pipes)
+
+        except BaseException:
+            self.close_pty()
+            raise
+
+        finally:
+            # Only the child keeps the slave side open, so reads
+            # hit EOF once it (and anything it started) exits
+            if slave is not None:
+                os.close(slave)
+
+        self.spawn_time = time.perf_counter() - self.started
+        record_spawn(method, self.spawn_time)
+
+        self.task = scriptlib.loop.create_task(self.handle_output())
+
+    async def wait(
+            self
+        ) -> None:
+        """
+        Waits for a started command to finish.
+        Raises SubprocessError on a non-zero exit code, or
+        SubprocessTimeout if it had to be killed for taking
+        too long.
+
+        Cancelling the task running this kills the command.
+        """
+
+        try:
+            if self.deadline is None:
+                await self.process.wait()
+
+            else:
+                await asyncio.wait_for(
+                    self.process.wait(),
+                    max(0, self.deadline - time.perf_counter())
+                )
+
+        except asyncio.TimeoutError:
+            self.timed_out = True
+            reap_stats["timed_out"] += 1
+
+            await self.kill()
+
+        except asyncio.CancelledError:
+            reap_stats["cancelled"] += 1
+
+            await self.kill()
+            self.task.cancel()
+            raise
+
+        if self.kill_signal is None:
+            reap_stats["exited"] += 1
+
+        # Make sure all output is read before returning
+        await self.drain()
+        self.finish_logs()
+
+        self.finished = time.perf_counter()
+
+        if self.timed_out:
+            raise exceptions.SubprocessTimeout(f"'{self.command}' timed out after {self.timeout}s")
 
         if self.process.returncode != 0:
             # TODO: Implement logging
             # logger.log("subprocess", "error", f"Subprocess call for '{self.command}' returned non-zero exit code: {self.process.returncode}")
             raise exceptions.SubprocessError(self.process.returncode)
 
-    async def kill(
+    async def drain(
             self
         ) -> None:
         """
-        Prematurely kills the running task.
+        Waits for the output readers to finish.
+
+        If the command was killed (or timed out), something
+        that escaped its process group could still hold the
+        pipes open, so this only waits for so long.
+        """
+
+        if self.kill_signal is None and not self.timed_out:
+            await self.task
+            return
+
+        try:
+            await asyncio.wait_for(asyncio.shield(self.task), self.grace)
+
+        except asyncio.TimeoutError:
+            self.task.cancel()
+
+    async def kill(
+            self,
+            grace: Optional[float] = None
+        ) -> None:
+        """
+        Kills the command and everything it started.
+
+        The process group gets SIGTERM first, then SIGKILL if
+        it's still around after the grace period. The group is
+        signalled even if the command itself already exited,
+        since whatever it started in the background can still
+        be holding its pipes open.
+
+        Arguments:
+            grace: Optional[float] - Overrides the command's grace period
+        """
+
+        if self.process is None:
+            return
+
+        if self.process.returncode is not None and self.task.done():
+            # Fully finished - nothing left to signal
+            return
+
+        grace = self.grace if grace is None else grace
+        signalled = time.perf_counter()
+
+        self.signal(signal.SIGTERM)
+
+        try:
+            await asyncio.wait_for(self.process.wait(), grace)
+
+        except asyncio.TimeoutError:
+            self.signal(signal.SIGKILL)
+
+            try:
+                # Waits for the pipes too, which something outside
+                # the group could keep open - drain() handles that
+                await asyncio.wait_for(self.process.wait(), grace)
+
+            except asyncio.TimeoutError:
+                pass
+
+        except asyncio.CancelledError:
+            # Don't leave it running just because we stopped waiting
+            self.signal(signal.SIGKILL)
+            raise
+
+        self.reap_time = time.perf_counter() - signalled
+
+        reap_stats["killed" if self.kill_signal == signal.SIGKILL else "terminated"] += 1
+        reap_stats["reap_time"] += self.reap_time
+
+    def signal(
+            self,
+            sig: int
+        ) -> None:
+        """
+        Sends a signal to the command's process group.
+
+        Arguments:
+            sig: int - Signal to send
         """
-        self.process.terminate()
-    
-    async def handle_stdout(
+
+        self.kill_signal = sig
+
+        try:
+            os.killpg(self.process.pid, sig)
+
+        except ProcessLookupError:
+            pass
+
+        except PermissionError:
+            # Group's gone and the ID was reused - only signal our process
+            try:
+                self.process.send_signal(sig)
+
+            except ProcessLookupError:
+                pass
+
+    async def handle_output(
             self
         ) -> None:
         """
-        Handles output of the command.
+        Reads every output stream of the command.
         """
-        while not self.process.returncode:
-            # Process is still running
+
+        if self.pty:
             try:
-                msg = await self.process.stdout.readuntil(b"\n")
-                data = msg.decode("ascii").rstrip()
+                await self.read_stream(PtyReader(self.master), self.streams["stdout"])
 
-                self.data.append(data)
+            finally:
+                self.close_pty()
 
-                # We will eventually log this
-                #terminal.log_raw("subprocess", "info", data, True)
-                scriptlib.terminal.log(f"> {data}", True)
+            return
 
-            except asyncio.IncompleteReadError:
-                break
-                #logger.log("warn", "Subprocess exited while reading.")
+        readers = [self.read_stream(self.process.stdout, self.streams["stdout"])]
+
+        if "stderr" in self.streams:
+            readers.append(self.read_stream(self.process.stderr, self.streams["stderr"]))
+
+        await asyncio.gather(*readers)
+
+    def resize(
+            self,
+            columns: int,
+            rows: int
+        ) -> None:
+        """
+        Sets the size of the command's pty, and lets it know
+        it changed. Called when the terminal is resized.
+
+        Arguments:
+            columns: int - Width of the log area
+            rows: int - Height of the log area
+        """
+
+        if self.master is None:
+            return
+
+        columns = max(columns - len(self.get_prefix(self.streams["stdout"])), 1)
+
+        fcntl.ioctl(
+            self.master,
+            termios.TIOCSWINSZ,
+            struct.pack("HHHH", max(rows, 1), columns, 0, 0)
+        )
+
+        if self.process is not None and self.process.returncode is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGWINCH)
 
-            except asyncio.LimitOverrunError:
-                # Shouldn't happen yet.
-                # TODO
-                #humecord.logger.log("subprocess", "warn", "Subprocess limit overrun. Can't read data.")
+            except OSError:
                 pass
 
-            except:
-                #humecord.logger.log("subprocess", "error", "Failed to read data from subprocess.")
-                pass
\ No newline at end of file
+    def close_pty(
+            self
+        ) -> None:
+        """
+        Closes the master side of the pty and stops
+        forwarding resizes to it.
+        """
+
+        if self.master is None:
+            return
+
+        master = self.master
+        self.master = None
+
+        os.close(master)
+
+        listeners = getattr(scriptlib.terminal, "resize_listeners", [])
+
+        if self.resize in listeners:
+            listeners.remove(self.resize)
+
+    async def read_stream(
+            self,
+            pipe: asyncio.StreamReader,
+            stream: "OutputStream"
+        ) -> None:
+        """
+        Handles output of one stream.
+
+        Reads in large chunks and splits them into lines in bulk,
+        rather than awaiting every line separately.
+
+        Arguments:
+            pipe: asyncio.StreamReader - Pipe to read
+            stream: OutputStream - Where the lines go
+        """
+
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors = "replace")
+
+        while True:
+            chunk = await pipe.read(self.chunk_size)
+
+            if not chunk:
+                # EOF
+                break
+
+            self.bytes_read += len(chunk)
+
+            self.feed(decoder.decode(chunk), stream.name)
+
+            # Waits here while a streaming consumer is behind
+            await stream.forward()
+
+        # Flush anything left in the decoder, plus the last unterminated line
+        self.feed(decoder.decode(b"", final = True), stream.name)
+        self.flush_partial(stream.name)
+
+        await stream.forward()
+        await stream.end()
+
+    def feed(
+            self,
+            text: str,
+            name: str = "stdout"
+        ) -> None:
+        """
+        Splits decoded output into lines.
+
+        Arguments:
+            text: str - Decoded output
+            name: str - Stream it came from
+        """
+
+        if text == "":
+            return
+
+        stream = self.streams[name]
+        lines = text.split("\n")
+
+        if len(lines) == 1:
+            # Still in the middle of a line
+            self.feed_partial(text, name)
+            return
+
+        # First line finishes whatever was partially read
+        self.feed_partial(lines[0], name)
+        lines[0] = "".join(stream.partial)
+
+        # Last one is the start of a new (unfinished) line
+        stream.partial = []
+        stream.partial_len = 0
+
+        complete = lines[:-1]
+
+        if any(len(line) > self.max_line for line in complete):
+            complete = [
+                line[i:i + self.max_line]
+                for line in complete
+                for i in range(0, max(len(line), 1), self.max_line)
+            ]
+
+        self.add_lines(complete, name)
+
+        self.feed_partial(lines[-1], name)
+
+    def feed_partial(
+            self,
+            text: str,
+            name: str = "stdout"
+        ) -> None:
+        """
+        Adds text to the line that's currently being read.
+
+        Arguments:
+            text: str - Text without any newlines
+            name: str - Stream it came from
+        """
+
+        if text == "":
+            return
+
+        stream = self.streams[name]
+
+        stream.partial.append(text)
+        stream.partial_len += len(text)
+
+        if self.pty and "\r" in text:
+            # Only the text after the last carriage return is still
+            # visible (or before it, if nothing's been written over it yet)
+            kept = "\r".join("".join(stream.partial).split("\r")[-2:])
+
+            stream.partial = [kept]
+            stream.partial_len = len(kept)
+
+            self.show_live(collapse_cr(kept), stream)
+
+        # Stream huge lines out in max_line pieces, instead of
+        # buffering them forever
+        if stream.partial_len >= self.max_line:
+            text = "".join(stream.partial)
+            cut = len(text) - len(text) % self.max_line
+
+            self.add_lines(
+                [text[i:i + self.max_line] for i in range(0, cut, self.max_line)],
+                name
+            )
+
+            stream.partial = [text[cut:]] if cut < len(text) else []
+            stream.partial_len = len(text) - cut
+
+    def flush_partial(
+            self,
+            name: str = "stdout"
+        ) -> None:
+        """
+        Adds the line that's currently being read, even
+        though it hasn't ended.
+
+        Arguments:
+            name: str - Stream to flush
+        """
+
+        stream = self.streams[name]
+
+        if stream.partial_len > 0:
+            self.add_lines(["".join(stream.partial)], name)
+            stream.partial = []
+            stream.partial_len = 0
+
+    def add_lines(
+            self,
+            lines: list,
+            name: str = "stdout"
+        ) -> None:
+        """
+        Stores and logs complete lines.
+
+        Arguments:
+            lines: list - Lines to add
+            name: str - Stream they came from
+        """
+
+        stream = self.streams[name]
+
+        if self.pty:
+            lines = [collapse_cr(line) for line in lines]
+
+        else:
+            lines = [line.rstrip("\r") for line in lines]
+
+        stream.output.add(lines)
+        self.lines_read += len(lines)
+
+        if stream.queue is not None:
+            stream.batch.extend(lines)
+
+        if self.log or self.tee:
+            for line in lines:
+                # Runs of the same line are logged once, with a count
+                if line == stream.last_line:
+                    stream.repeats += 1
+                    continue
+
+                self.log_repeats(stream)
+
+                stream.last_line = line
+                self.log_line(line, stream)
+
+            # Redraws are batched, so many busy commands don't repaint per line
+            scriptlib.terminal.request_reprint(logs = True)
+
+    def log_line(
+            self,
+            line: str,
+            stream: "OutputStream"
+        ) -> None:
+        """
+        Logs a line of output.
+
+        Arguments:
+            line: str
+            stream: OutputStream - Stream it came from
+        """
+
+        prefix = self.get_prefix(stream)
+
+        if self.tee:
+            scriptlib.script.logger.log_raw(
+                "warn" if stream.name == "stderr" else "info",
+                "subprocess",
+                f"{prefix}{line}",
+                update = False
+            )
+
+        else:
+            # Finish a line that's been shown while it was being drawn
+            if stream.row is not None:
+                row = stream.row
+                stream.row = None
+
+                if row == len(scriptlib.terminal.lines) - 1:
+                    scriptlib.terminal.replace_last(f"{prefix}{line}")
+                    return
+
+            scriptlib.terminal.log(f"{prefix}{line}")
+
+    def show_live(
+            self,
+            text: str,
+            stream: "OutputStream"
+        ) -> None:
+        """
+        Shows an unfinished line that's being redrawn
+        with carriage returns. Updated in place while it's
+        still the last logged line.
+
+        Arguments:
+            text: str - What the line currently shows
+            stream: OutputStream - Stream it came from
+        """
+
+        if not self.log or self.tee or text == "":
+            return
+
+        terminal = scriptlib.terminal
+        line = f"{self.get_prefix(stream)}{text}"
+
+        if stream.row is not None and stream.row == len(terminal.lines) - 1:
+            terminal.replace_last(line)
+
+        else:
+            terminal.log(line)
+            stream.row = len(terminal.lines) - 1
+
+        terminal.request_reprint(logs = True)
+
+    def get_prefix(
+            self,
+            stream: "OutputStream"
+        ) -> str:
+        """
+        Gets the prefix logged lines of a stream get.
+
+        Arguments:
+            stream: OutputStream
+        """
+
+        marker = "!" if stream.name == "stderr" else ">"
+
+        return f"{self.label} {marker} " if self.label else f"{marker} "
+
+    def log_repeats(
+            self,
+            stream: "OutputStream"
+        ) -> None:
+        """
+        Logs how many times the last line was repeated,
+        if it was.
+
+        Arguments:
+            stream: OutputStream
+        """
+
+        if stream.repeats > 0:
+            plural = "s" if stream.repeats != 1 else ""
+            self.log_line(f"(repeated {stream.repeats} more time{plural})", stream)
+            stream.repeats = 0
+
+    def finish_logs(
+            self
+        ) -> None:
+        """
+        Logs any pending repeat counts once output ends.
+        """
+
+        if self.log or self.tee:
+            for stream in self.streams.values():
+                self.log_repeats(stream)
+
+class OutputStream:
+    """
+    State for one output stream (stdout or stderr)
+    of a Command.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            output,
+            buffer: Optional[int]
+        ) -> None:
+        """
+        Arguments:
+            name: str - stdout or stderr
+            output: Capture for the stream's lines
+            buffer: Optional[int] - Chunks to hold for a streaming
+                consumer, or None if it isn't streamed
+        """
+
+        self.name = name
+        self.output = output
+
+        # Pieces of the line that's currently being read
+        self.partial = []
+        self.partial_len = 0
+
+        # Last logged line, for coalescing repeats
+        self.last_line = None
+        self.repeats = 0
+
+        # Log row of a line that's being redrawn in place (pty)
+        self.row = None
+
+        # Bounded, so a slow consumer stalls the reader (and
+        # eventually the process) instead of filling memory
+        self.queue = asyncio.Queue(buffer) if buffer is not None else None
+        self.batch = []
+        self.iterating = False
+
+    async def forward(
+            self
+        ) -> None:
+        """
+        Passes lines read so far to the streaming consumer.
+        Waits if it's too far behind.
+        """
+
+        if self.queue is None or len(self.batch) == 0:
+            return
+
+        batch = self.batch
+        self.batch = []
+
+        await self.queue.put(batch)
+
+    async def end(
+            self
+        ) -> None:
+        """
+        Tells the streaming consumer there's nothing left.
+        """
+
+        if self.queue is not None:
+            await self.queue.put(None)
+
+    async def iterate(
+            self
+        ):
+        """
+        Iterates over lines as they're read.
+        """
+
+        if self.queue is None:
+            raise exceptions.DevError("Output isn't streamed - use stream = True")
+
+        if self.iterating:
+            raise exceptions.DevError(f"{self.name} already has a consumer")
+
+        self.iterating = True
+
+        while True:
+            batch = await self.queue.get()
+
+            if batch is None:
+                return
+
+            for line in batch:
+                yield line
+
+class PtyReader:
+    """
+    Reads the master side of a pty through the event
+    loop's reader callbacks, with the same read() as a
+    StreamReader.
+    """
+
+    def __init__(
+            self,
+            fd: int
+        ) -> None:
+        """
+        Arguments:
+            fd: int - Non-blocking master fd
+        """
+
+        self.fd = fd
+
+    async def read(
+            self,
+            size: int
+        ) -> bytes:
+        """
+        Reads up to size bytes, waiting until there's something.
+
+        Arguments:
+            size: int - Max bytes to read
+
+        Returns:
+            data: bytes - Empty at EOF
+        """
+
+        while True:
+            try:
+                return os.read(self.fd, size)
+
+            except BlockingIOError:
+                pass
+
+            except OSError as e:
+                # Linux raises EIO once every copy of the slave is closed
+                if e.errno == errno.EIO:
+                    return b""
+
+                raise
+
+            ready = scriptlib.loop.create_future()
+
+            scriptlib.loop.add_reader(
+                self.fd,
+                lambda: ready.done() or ready.set_result(None)
+            )
+
+            try:
+                await ready
+
+            finally:
+                scriptlib.loop.remove_reader(self.fd)
+
+def collapse_cr(
+        line: str
+    ) -> str:
+    """
+    Gets what a line redrawn with carriage returns ends
+    up showing (roughly - the last thing drawn).
+
+    Arguments:
+        line: str
+    """
+
+    for segment in reversed(line.split("\r")):
+        if segment != "":
+            return segment
+
+    return ""
+
+class CommandPool:
+    """
+    Runs many commands concurrently, with a limit on
+    how many can run at once.
+
+    Sample:
+        pool = subprocess.CommandPool(limit = 16, timeout = 30)
+
+        for host in hosts:
+            pool.add(f"ssh {host} uptime", label = host)
+
+        async for command in pool.as_completed():
+            ...
+
+        print(pool.summary)
+    """
+
+    def __init__(
+            self,
+            limit: int = 8,
+            timeout: Optional[float] = None,
+            **kwargs
+        ) -> None:
+        """
+        Creates a pool.
+
+        Arguments:
+            limit: int - Max commands running at once
+            timeout: Optional[float] - Default per-command timeout, in
+                seconds. Counts from when the command starts, not
+                from when it's queued.
+            **kwargs - Default arguments for each Command()
+        """
+
+        if limit < 1:
+            raise exceptions.DevError("Pool limit must be at least 1")
+
+        self.semaphore = asyncio.Semaphore(limit)
+        self.timeout = timeout
+        self.kwargs = kwargs
+
+        self.commands = []
+        self.tasks = []
+
+    def add(
+            self,
+            command: str,
+            timeout: Optional[float] = None,
+            **kwargs
+        ) -> Command:
+        """
+        Queues a command. It starts as soon as there's room.
+
+        Arguments:
+            command: str - Command to run
+            timeout: Optional[float] - Overrides the pool's timeout
+            **kwargs - Overrides the pool's Command() arguments
+
+        Returns:
+            command: Command - The (not yet started) command
+        """
+
+        kwargs = {
+            **self.kwargs,
+            **kwargs
+        }
+
+        if "label" not in kwargs:
+            kwargs["label"] = f"[{len(self.commands) + 1}]"
+
+        cmd = Command(
+            command,
+            timeout = self.timeout if timeout is None else timeout,
+            **kwargs
+        )
+
+        self.commands.append(cmd)
+        self.tasks.append(
+            scriptlib.loop.create_task(
+                self.execute(cmd)
+            )
+        )
+
+        return cmd
+
+    async def execute(
+            self,
+            cmd: Command
+        ) -> Command:
+        """
+        Runs one command once there's room in the pool.
+
+        Arguments:
+            cmd: Command
+
+        Returns:
+            cmd: Command - Finished command
+        """
+
+        async with self.semaphore:
+            await cmd.start()
+
+            try:
+                await cmd.wait()
+
+            except exceptions.SubprocessError:
+                # Exit codes and timeouts are collected in the summary instead
+                pass
+
+        return cmd
+
+    def cancel(
+            self
+        ) -> None:
+        """
+        Cancels every queued or running command.
+        Running ones are killed.
+        """
+
+        for task in self.tasks:
+            task.cancel()
+
+    async def as_completed(
+            self
+        ):
+        """
+        Iterates over commands as they finish.
+        """
+
+        for future in asyncio.as_completed(self.tasks):
+            yield await future
+
+    async def wait(
+            self
+        ) -> list:
+        """
+        Waits for every queued command to finish.
+
+        Returns:
+            commands: list - All commands, in the order they were added
+        """
+
+        return list(await asyncio.gather(*self.tasks))
+
+    @property
+    def statuses(self) -> list:
+        """
+        Gets the exit code of every command (None if it
+        hasn't finished).
+        """
+
+        return [cmd.returncode for cmd in self.commands]
+
+    @property
+    def summary(self) -> dict:
+        """
+        Gets aggregate results.
+
+        Returns:
+            summary: dict - total, succeeded, failed, timed_out, running
+        """
+
+        summary = {
+            "total": len(self.commands),
+            "succeeded": 0,
+            "failed": 0,
+            "timed_out": 0,
+            "running": 0
+        }
+
+        for cmd in self.commands:
+            if cmd.timed_out:
+                summary["timed_out"] += 1
+
+            elif cmd.finished is None:
+                summary["running"] += 1
+
+            elif cmd.returncode == 0:
+                summary["succeeded"] += 1
+
+            else:
+                summary["failed"] += 1
+
+        return summary
+
+    @property
+    def exit_code(self) -> int:
+        """
+        Gets an aggregate exit code: 0 if everything
+        succeeded, otherwise the first failing code.
+        """
+
+        for cmd in self.commands:
+            if cmd.returncode:
+                return cmd.returncode
+
+        return 0
+
+def get_capture(
+        capture: str,
+        max_lines: Optional[int] = None,
+        max_bytes: Optional[int] = None
+    ):
+    """
+    Creates an output capture.
+
+    Arguments:
+        capture: str - all, ring, file, or none
+        max_lines: Optional[int] - Line limit (ring)
+        max_bytes: Optional[int] - Byte limit (ring)
+    """
+
+    if capture == "all":
+        return ListCapture()
+
+    elif capture == "ring":
+        if max_lines is None and max_bytes is None:
+            raise exceptions.DevError("Ring capture needs max_lines or max_bytes")
+
+        return RingCapture(max_lines, max_bytes)
+
+    elif capture == "file":
+        return FileCapture()
+
+    elif capture == "none":
+        return RingCapture(0, None)
+
+    raise exceptions.DevError(f"Invalid capture mode {capture}")
+
+class ListCapture:
+    """
+    Keeps every line of output in memory.
+    """
+
+    def __init__(
+            self
+        ) -> None:
+        self.data = []
+
+    def add(
+            self,
+            lines: list
+        ) -> None:
+        self.data += lines
+
+    def lines(
+            self
+        ) -> Iterator[str]:
+        return iter(self.data)
+
+    def text(
+            self
+        ) -> str:
+        return "\n".join(self.data)
+
+    def close(
+            self
+        ) -> None:
+        self.data = []
+
+class RingCapture:
+    """
+    Keeps only the most recent lines of output, bounded
+    by line count and/or total size.
+    """
+
+    def __init__(
+            self,
+            max_lines: Optional[int] = None,
+            max_bytes: Optional[int] = None
+        ) -> None:
+        """
+        Arguments:
+            max_lines: Optional[int] - Lines to keep
+            max_bytes: Optional[int] - Bytes (UTF-8) to keep
+        """
+
+        self.data = deque(maxlen = max_lines)
+        self.sizes = deque()
+        self.max_bytes = max_bytes
+        self.size = 0
+
+        # Lines that were pushed out
+        self.dropped = 0
+
+    def add(
+            self,
+            lines: list
+        ) -> None:
+        for line in lines:
+            if self.data.maxlen == 0:
+                self.dropped += 1
+                continue
+
+            if len(self.data) == self.data.maxlen:
+                # deque drops the oldest line itself
+                self.size -= self.sizes.popleft()
+                self.dropped += 1
+
+            size = len(line.encode("utf-8", "replace")) + 1
+
+            self.data.append(line)
+            self.sizes.append(size)
+            self.size += size
+
+            if self.max_bytes is not None:
+                while self.size > self.max_bytes and len(self.data) > 0:
+                    self.data.popleft()
+                    self.size -= self.sizes.popleft()
+                    self.dropped += 1
+
+    def lines(
+            self
+        ) -> Iterator[str]:
+        return iter(self.data)
+
+    def text(
+            self
+        ) -> str:
+        return "\n".join(self.data)
+
+    def close(
+            self
+        ) -> None:
+        self.data.clear()
+        self.sizes.clear()
+        self.size = 0
+
+class FileCapture:
+    """
+    Spills output to an anonymous temp file, so memory
+    use stays flat no matter how much is captured.
+    """
+
+    def __init__(
+            self
+        ) -> None:
+        self.file = tempfile.TemporaryFile()
+        self.size = 0
+        self.count = 0
+        self.map = None
+
+    def add(
+            self,
+            lines: list
+        ) -> None:
+        if len(lines) == 0:
+            return
+
+        data = ("\n".join(lines) + "\n").encode("utf-8", "replace")
+
+        self.file.write(data)
+        self.size += len(data)
+        self.count += len(lines)
+
+    def view(
+            self
+        ):
+        """
+        Maps everything written so far.
+
+        Returns:
+            view: mmap.mmap (or empty bytes if nothing's captured)
+        """
+
+        self.file.flush()
+
+        if self.map is None or len(self.map) != self.size:
+            if self.map is not None:
+                self.map.close()
+
+            if self.size == 0:
+                # Empty files can't be mapped
+                return b""
+
+            self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+
+        return self.map
+
+    def lines(
+            self
+        ) -> Iterator[str]:
+        if self.size == 0:
+            return
+
+        view = self.view()
+        start = 0
+
+        while start < self.size:
+            end = view.find(b"\n", start)
+
+            yield view[start:end].decode("utf-8", "replace")
+
+            start = end + 1
+
+    def text(
+            self
+        ) -> str:
+        if self.size == 0:
+            return ""
+
+        # Drop the final newline, to match the other captures
+        return self.view()[:self.size - 1].decode("utf-8", "replace")
+
+    def close(
+            self
+        ) -> None:
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+        self.file.close()
\ No newline at end of file
@@ -5,8 +5,7 @@ Manages the users on this computer.
 """
 
 from . import (
-    exceptions,
-    subprocess
+    cmdcache
 )
 
 import scriptlib
@@ -16,7 +15,8 @@ from typing import Optional
 
 async def get_user() -> str:
     """
-    Gets the active user.
+    Gets the active user. Cached, since it can't change
+    while the script runs.
     """
 
-    return " ".join((await subprocess.run("whoami")).data).strip()
\ No newline at end of file
+    return (await cmdcache.cache.run(["whoami"])).result.strip()
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""
+Tests for TaskSubscript.plan() (dry runs) against a journal.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import types
+
+import pytest
+
+# Importing scriptlib itself takes over the terminal, so the
+# subscript is loaded from a bare package instead
+package = types.ModuleType("scriptlib")
+package.__path__ = [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scriptlib")]
+sys.modules.setdefault("scriptlib", package)
+
+import scriptlib
+from scriptlib.subscripts.task import TaskSubscript
+
+class Logger:
+    """
+    Keeps logged lines instead of printing them.
+    """
+
+    def __init__(self):
+        self.lines = []
+
+    def log(self, level, source, message, **kwargs):
+        self.lines.append(message)
+
+    def log_step(self, level, source, message, **kwargs):
+        self.lines.append(message)
+
+@pytest.fixture
+def logger(monkeypatch):
+    logger = Logger()
+
+    monkeypatch.setattr(scriptlib, "script", types.SimpleNamespace(name = "test", logger = logger), raising = False)
+
+    return logger
+
+def make_subscript(tmp_path, restart = False):
+    async def task():
+        raise AssertionError("plan() shouldn't run tasks")
+
+    return TaskSubscript(
+        {"name": "a", "description": "", "function": task},
+        {"name": "b", "description": "", "function": task, "depends_on": ["a"]},
+        {"name": "c", "description": "", "function": task, "depends_on": ["b"]},
+        name = "plan",
+        report_path = str(tmp_path / "report.json"),
+        state_path = str(tmp_path / "state.json"),
+        journal_path = str(tmp_path / "journal.json"),
+        force = False,
+        dry_run = True,
+        restart = restart
+    )
+
+def write_journal(tmp_path, completed):
+    journal = {
+        "started": 0,
+        "completed": completed,
+        "attempts": {},
+        "failed": []
+    }
+
+    with open(tmp_path / "journal.json", "w") as f:
+        json.dump(journal, f)
+
+    return journal
+
+def test_plan_resumes_journal(tmp_path, logger):
+    journal = write_journal(tmp_path, ["a", "removed"])
+    subscript = make_subscript(tmp_path)
+
+    assert asyncio.run(subscript.plan()) == ["b", "c"]
+
+    assert "a: completed (resumed)" in logger.lines
+    assert "b: would run" in logger.lines
+    assert "a" in subscript.executed
+
+    # Dry runs leave the journal alone
+    with open(tmp_path / "journal.json") as f:
+        assert json.load(f) == journal
+
+def test_plan_restart_ignores_journal(tmp_path, logger):
+    journal = write_journal(tmp_path, ["a"])
+    subscript = make_subscript(tmp_path, restart = True)
+
+    assert asyncio.run(subscript.plan()) == ["a", "b", "c"]
+
+    assert "a: completed (resumed)" not in logger.lines
+
+    with open(tmp_path / "journal.json") as f:
+        assert json.load(f) == journal
+
+def test_plan_without_journal(tmp_path, logger):
+    subscript = make_subscript(tmp_path)
+
+    assert asyncio.run(subscript.plan()) == ["a", "b", "c"]
+
+    assert not os.path.exists(tmp_path / "journal.json")